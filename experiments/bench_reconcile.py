@@ -0,0 +1,132 @@
+"""Benchmark StreamlitApp reconcile throughput against a local fake API server.
+
+Compares the old serial path (one app at a time, three blocking child writes one after another) with the async
+`create_fn` handler (child writes in parallel, many apps in flight up to `maxConcurrentReconciles`). The async run then
+replays an `update_fn` with an unchanged spec for every app, which should not write any child.
+
+    python experiments/bench_reconcile.py --apps 300 --latency-ms 20 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import kopf
+import kubernetes
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "streamlit-operator"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import main  # noqa: E402
+from fake_kube_api import FakeKubeApi  # noqa: E402
+from app_status import AppStatusWriter  # noqa: E402
+from kube_clients import KubeClients  # noqa: E402
+from streamlit_app_manifest_templating import template_deployment, template_ingress, template_service  # noqa: E402
+from streamlit_app_spec_schema import StreamlitAppSpec  # noqa: E402
+from streamlit_operator_config import StreamlitOperatorConfig  # noqa: E402
+
+logger = logging.getLogger("bench")
+
+
+def make_body(name: str) -> dict:
+    return {
+        "apiVersion": "fetch.com/v1",
+        "kind": "StreamlitApp",
+        "metadata": {"name": name, "namespace": "streamlit", "uid": str(uuid.uuid4())},
+        "spec": {"repo": "https://example.com/repo.git", "ref": "main", "codeDir": f"apps/{name}"},
+    }
+
+
+def run_serial(names: list[str]) -> None:
+    api = kubernetes.client.CoreV1Api()
+    apps_api = kubernetes.client.AppsV1Api()
+    networking_api = kubernetes.client.NetworkingV1Api()
+    for name in names:
+        body = make_body(name)
+        spec = StreamlitAppSpec(**body["spec"])
+        apps_api.create_namespaced_deployment(
+            namespace="streamlit", body=template_deployment(name, spec, main.config.gitSyncAuthConfig)
+        )
+        api.create_namespaced_service(namespace="streamlit", body=template_service(name))
+        networking_api.create_namespaced_ingress(
+            namespace="streamlit", body=template_ingress(name, spec, main.make_dns_name(name))
+        )
+
+
+async def run_async(names: list[str]) -> dict[str, dict]:
+    async def one(name: str) -> dict:
+        body = make_body(name)
+        patch = kopf.Patch()
+        await main.create_fn(spec=body["spec"], name=name, namespace="streamlit", body=body, patch=patch, logger=logger)
+        return {"body": body, "status": dict(patch["status"])}
+
+    return dict(zip(names, await asyncio.gather(*(one(name) for name in names)), strict=True))
+
+
+async def run_noop_updates(created: dict[str, dict]) -> None:
+    async def one(state: dict) -> None:
+        body = state["body"]
+        await main.update_fn(
+            spec=body["spec"],
+            name=body["metadata"]["name"],
+            status=state["status"],
+            namespace="streamlit",
+            body=body,
+            patch=kopf.Patch(),
+            logger=logger,
+        )
+
+    await asyncio.gather(*(one(state) for state in created.values()))
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, default=300)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    main.config = StreamlitOperatorConfig(
+        baseDnsRecord="example.com",
+        maxConcurrentReconciles=args.concurrency,
+        gitSyncAuthConfig={"env": [], "volumeMounts": [], "volumes": []},
+    )
+    # Handlers fold their status into their own patch, so the writer's debounced flushes are never needed here
+    main.app_status = AppStatusWriter(main.patch_app_status, lambda _: {}, main.config.statusUpdates.debounceSeconds)
+
+    results = {}
+    for mode in ("serial", "async"):
+        server = FakeKubeApi(latency_s=args.latency_ms / 1000).start()
+        configuration = kubernetes.client.Configuration()
+        configuration.host = server.host
+        kubernetes.client.Configuration.set_default(configuration)
+
+        names = [f"app-{i}" for i in range(args.apps)]
+        start = time.perf_counter()
+        if mode == "serial":
+            run_serial(names)
+        else:
+            main.kube = KubeClients(args.concurrency)
+            created = asyncio.run(run_async(names))
+        elapsed = time.perf_counter() - start
+        if mode == "async":
+            writes_before = server.calls["PATCH"] + server.calls["PUT"]
+            asyncio.run(run_noop_updates(created))
+            noop_writes = server.calls["PATCH"] + server.calls["PUT"] - writes_before
+            main.kube.close()
+        server.stop()
+
+        assert len(server.objects) == 3 * args.apps, f"{mode}: expected {3 * args.apps} objects"
+        results[mode] = args.apps / elapsed
+        print(f"{mode:>6}: {args.apps} apps in {elapsed:.2f}s -> {results[mode]:.1f} apps/s")  # noqa: T201
+
+    print(f"speedup: {results['async'] / results['serial']:.1f}x")  # noqa: T201
+    print(f"child writes for {args.apps} no-op updates: {noop_writes}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,196 @@
+"""Run several operator replicas as separate processes against one fake API server, to check sharding and failover.
+
+Each replica process runs a `ShardCoordinator` and, once membership has converged, reconciles the apps it owns with the
+real `create_fn`. For every replica count the harness checks that exactly one replica leads and every app is owned by
+exactly one replica, and measures reconcile throughput, which should grow with the number of replicas. It then kills
+the leader without letting it leave, and checks that another replica takes over leadership and only the killed
+replica's apps move.
+
+The fake API server runs in a single process, so keep the per-replica concurrency low and the latency high enough for
+the API round trips (rather than the fake server itself) to bound each replica's throughput.
+
+    python experiments/bench_sharding.py --apps 200 --replicas 1 2 4 --latency-ms 100 --concurrency 2
+"""
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import queue
+import sys
+import time
+from pathlib import Path
+
+import kubernetes
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "streamlit-operator"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import main  # noqa: E402
+from app_status import AppStatusWriter  # noqa: E402
+from bench_reconcile import run_async  # noqa: E402
+from fake_kube_api import FakeKubeApi  # noqa: E402
+from kube_clients import KubeClients  # noqa: E402
+from sharding import HashRing, ShardCoordinator  # noqa: E402
+from streamlit_operator_config import StreamlitOperatorConfig  # noqa: E402
+
+
+def replica(identity: str, host: str, args: argparse.Namespace, commands, reports) -> None:
+    logging.basicConfig(level=logging.WARNING)
+    configuration = kubernetes.client.Configuration()
+    configuration.host = host
+    kubernetes.client.Configuration.set_default(configuration)
+    main.config = StreamlitOperatorConfig(
+        baseDnsRecord="example.com",
+        maxConcurrentReconciles=args.concurrency,
+        gitSyncAuthConfig={"env": [], "volumeMounts": [], "volumes": []},
+    )
+    main.kube = KubeClients(args.concurrency)
+    main.app_status = AppStatusWriter(main.patch_app_status, lambda _: {}, main.config.statusUpdates.debounceSeconds)
+    asyncio.run(replica_loop(identity, args, commands, reports))
+
+
+async def replica_loop(identity: str, args: argparse.Namespace, commands, reports) -> None:
+    async def noop(*_) -> None:
+        pass
+
+    shards = ShardCoordinator(main.kube, "streamlit", identity, args.lease_seconds, 1, noop, noop)
+    names = [f"app-{i}" for i in range(args.apps)]
+
+    async def reconcile(owned: list[str]) -> None:
+        start = time.perf_counter()
+        await run_async(owned)
+        reports.put(("reconciled", identity, len(owned), time.perf_counter() - start))
+
+    tasks = set()
+    while True:
+        await shards.tick()
+        owned = [name for name in names if shards.owns(name)]
+        reports.put(("state", identity, sorted(shards.ring.members), shards.leading, owned))
+        try:
+            command = commands.get_nowait()
+        except queue.Empty:
+            command = None
+        if command == "reconcile":
+            task = asyncio.create_task(reconcile(owned))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.sleep(args.renew_seconds)
+
+
+def drain(reports: dict) -> list[tuple]:
+    # One queue per replica: killing a replica while it writes to a shared queue could leave the queue's lock held
+    messages = []
+    for reports_ in reports.values():
+        while True:
+            try:
+                messages.append(reports_.get_nowait())
+            except queue.Empty:
+                break
+    return messages
+
+
+def wait_for(reports: dict, states: dict, done, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while not done():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Replicas did not converge: {states}")
+        for kind, identity, *rest in drain(reports):
+            if kind == "state":
+                states[identity] = rest
+        time.sleep(0.05)
+
+
+def converged(states: dict, identities: list[str]) -> bool:
+    return (
+        all(identity in states and states[identity][0] == sorted(identities) for identity in identities)
+        and sum(states[identity][1] for identity in identities) == 1
+    )
+
+
+def check_partition(states: dict, identities: list[str], apps: int) -> dict[str, str]:
+    owners = {}
+    for identity in identities:
+        for name in states[identity][2]:
+            assert name not in owners, f"{name} is owned by both {owners[name]} and {identity}"
+            owners[name] = identity
+    assert len(owners) == apps, f"{apps - len(owners)} apps are not owned by any replica"
+    assert owners == {name: HashRing(identities).owner(name) for name in owners}
+    return owners
+
+
+def run(replicas: int, args: argparse.Namespace) -> dict:
+    server = FakeKubeApi(latency_s=args.latency_ms / 1000).start()
+    ctx = multiprocessing.get_context("spawn")
+    identities = [f"operator-{i}" for i in range(replicas)]
+    commands = {identity: ctx.Queue() for identity in identities}
+    reports = {identity: ctx.Queue() for identity in identities}
+    processes = {
+        identity: ctx.Process(target=replica, args=(identity, server.host, args, commands[identity], reports[identity]))
+        for identity in identities
+    }
+    result = {}
+    try:
+        start = time.monotonic()
+        for process in processes.values():
+            process.start()
+        states: dict = {}
+        wait_for(reports, states, lambda: converged(states, identities), timeout=60)
+        result["converge_s"] = time.monotonic() - start
+        owners = check_partition(states, identities, args.apps)
+
+        start = time.monotonic()
+        for queue_ in commands.values():
+            queue_.put("reconcile")
+        pending = set(identities)
+        while pending:
+            pending -= {identity for kind, identity, *_ in drain(reports) if kind == "reconciled"}
+            time.sleep(0.01)
+        result["apps_per_s"] = args.apps / (time.monotonic() - start)
+        assert len(server.objects) >= 3 * args.apps, "Not every app was reconciled"
+
+        if replicas > 1:
+            leader = next(identity for identity in identities if states[identity][1])
+            processes[leader].kill()  # No graceful leave, the others have to wait for its leases to expire
+            del reports[leader]
+            survivors = [identity for identity in identities if identity != leader]
+            start = time.monotonic()
+            states = {}
+            wait_for(reports, states, lambda: converged(states, survivors), timeout=10 * args.lease_seconds)
+            result["failover_s"] = time.monotonic() - start
+            new_owners = check_partition(states, survivors, args.apps)
+            moved = {name for name in owners if owners[name] != new_owners[name]}
+            assert moved == {name for name in owners if owners[name] == leader}, "Apps of surviving replicas moved"
+            result["moved"] = len(moved)
+    finally:
+        for process in processes.values():
+            process.kill()
+            process.join()
+        server.stop()
+    return result
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, default=300)
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--latency-ms", type=float, default=100.0)
+    parser.add_argument("--concurrency", type=int, default=2, help="maxConcurrentReconciles of each replica")
+    parser.add_argument("--lease-seconds", type=int, default=3)
+    parser.add_argument("--renew-seconds", type=float, default=0.5)
+    args = parser.parse_args()
+    logging.getLogger("aiohttp.server").setLevel(logging.CRITICAL)  # Killed replicas drop their connections
+
+    for replicas in args.replicas:
+        result = run(replicas, args)
+        line = (
+            f"{replicas} replicas: converged in {result['converge_s']:.1f}s, "
+            f"{args.apps} apps at {result['apps_per_s']:.1f} apps/s"
+        )
+        if "failover_s" in result:
+            line += f", leader failover in {result['failover_s']:.1f}s moving {result['moved']} apps"
+        print(line)  # noqa: T201
+
+
+if __name__ == "__main__":
+    main_()
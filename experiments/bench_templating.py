@@ -0,0 +1,106 @@
+"""Micro-benchmark of the CPU spent per app on spec validation, templating, `kopf.adopt` and manifest hashing.
+
+This is the work `create_fn`, `update_fn` and every drift resync do for each app on the event loop, so it bounds how
+many apps one operator replica can keep reconciled. Each fleet size runs every stage over the same set of distinct
+apps twice: the first pass sees each spec for the first time, the second one replays them as a resync would.
+
+    python experiments/bench_templating.py --apps 1000 10000
+"""
+
+import argparse
+import sys
+import time
+import uuid
+from collections.abc import Callable
+from pathlib import Path
+
+import kopf
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "streamlit-operator"))
+
+import main  # noqa: E402
+from streamlit_app_manifest_templating import (  # noqa: E402
+    hash_manifest,
+    template_hpa,
+    template_ingress,
+    template_service,
+)
+from streamlit_app_spec_schema import StreamlitAppSpec  # noqa: E402
+from streamlit_operator_config import StreamlitOperatorConfig  # noqa: E402
+
+
+def make_apps(count: int) -> list[tuple[str, dict, dict]]:
+    apps = []
+    for i in range(count):
+        name = f"app-{i}"
+        spec = {"repo": f"https://github.com/example/repo-{i % 50}.git", "ref": "main", "codeDir": f"apps/{name}"}
+        if i % 5 == 0:
+            spec["autoscaling"] = {"enabled": True, "maxReplicas": 3}
+        if i % 7 == 0:
+            spec["resources"] = {"profile": "medium", "streamlit": {"limits": {"memory": "2Gi"}}}
+        owner = {
+            "apiVersion": "fetch.com/v1",
+            "kind": "StreamlitApp",
+            "metadata": {"name": name, "namespace": "streamlit", "uid": str(uuid.uuid4())},
+        }
+        apps.append((name, spec, owner))
+    return apps
+
+
+def timed(apps: list, fn: Callable) -> float:
+    start = time.perf_counter()
+    for app in apps:
+        fn(*app)
+    return (time.perf_counter() - start) / len(apps) * 1e6
+
+
+def run(count: int) -> dict[str, tuple[float, float]]:
+    apps = make_apps(count)
+    main.validate_spec.cache_clear()
+    specs = {name: StreamlitAppSpec(**spec) for name, spec, _ in apps}
+    children = {
+        name: main.template_children(name, specs[name], f"{name}.example.com", owner) for name, _, owner in apps
+    }
+
+    def adopt(name, _, owner):
+        for manifest in (template_service(name), template_ingress(name, specs[name], "x")):
+            kopf.adopt(manifest, owner=owner)
+
+    def reconcile(name, spec, owner):
+        parsed = main.parse_spec(spec)
+        rendered = main.template_children(name, parsed, main.make_dns_name(name), owner)
+        return {child: hash_manifest(manifest) for child, manifest in rendered.items()}
+
+    stages = {
+        "validate": lambda _, spec, __: main.parse_spec(spec),
+        "service+ingress+hpa": lambda name, *_: (
+            template_service(name),
+            template_ingress(name, specs[name], "x"),
+            template_hpa(name, specs[name]),
+        ),
+        "children (with adopt)": lambda name, _, owner: main.template_children(name, specs[name], "x", owner),
+        "adopt service+ingress": adopt,
+        "hash": lambda name, *_: [hash_manifest(manifest) for manifest in children[name].values()],
+        "full reconcile path": reconcile,
+    }
+    return {stage: (timed(apps, fn), timed(apps, fn)) for stage, fn in stages.items()}
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, nargs="+", default=[1000, 10000])
+    args = parser.parse_args()
+
+    main.config = StreamlitOperatorConfig(
+        baseDnsRecord="example.com",
+        gitPoller={"enabled": True},
+        gitSyncAuthConfig={"env": [], "volumeMounts": [], "volumes": []},
+    )
+    for count in args.apps:
+        print(f"{count} apps (us per app, first pass / repeat pass):")  # noqa: T201
+        for stage, (first, repeat) in run(count).items():
+            print(f"  {stage:<24} {first:8.1f} / {repeat:8.1f}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,68 @@
+"""Check drift detection (`drift.is_subset`) against live objects as the API server returns them.
+
+The server drops empty maps, lists and strings and stores resource quantities in canonical form, so a child applied
+from its template must not look drifted for that alone, while real changes to it must.
+
+    python experiments/check_drift.py
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "streamlit-operator"))
+
+from drift import is_subset  # noqa: E402
+
+CONTAINER = {"name": "streamlit", "env": [{"name": "A", "value": "1"}], "resources": {"limits": {"memory": "1Gi"}}}
+
+# name -> (desired, live, drifted)
+CASES = {
+    "empty annotations, omitted": ({"metadata": {"annotations": {}}}, {"metadata": {"name": "x"}}, False),
+    "empty env value, omitted": ({"env": [{"name": "A", "value": ""}]}, {"env": [{"name": "A"}]}, False),
+    "empty requests, omitted": (
+        {"resources": {"requests": {}, "limits": {"cpu": "1"}}},
+        {"resources": {"limits": {"cpu": "1"}}},
+        False,
+    ),
+    "empty list, omitted": ({"spec": {"tolerations": []}}, {"spec": {}}, False),
+    "none, omitted": ({"spec": {"priorityClassName": None}}, {"spec": {}}, False),
+    "nested empties, no parent": ({"metadata": {"annotations": {}, "labels": {}}}, {}, False),
+    "cpu 0.5 as 500m": ({"resources": {"limits": {"cpu": "0.5"}}}, {"resources": {"limits": {"cpu": "500m"}}}, False),
+    "cpu 1 as number": ({"resources": {"requests": {"cpu": 1}}}, {"resources": {"requests": {"cpu": "1"}}}, False),
+    "memory 1024Mi as 1Gi": (
+        {"resources": {"limits": {"memory": "1024Mi"}}},
+        {"resources": {"limits": {"memory": "1Gi"}}},
+        False,
+    ),
+    "server defaults": (CONTAINER, {**CONTAINER, "imagePullPolicy": "IfNotPresent"}, False),
+    "missing child": ({"kind": "Service", "metadata": {"name": "x"}}, None, True),
+    "annotation changed": ({"metadata": {"annotations": {"a": "b"}}}, {"metadata": {"annotations": {"a": "c"}}}, True),
+    "annotation removed": ({"metadata": {"annotations": {"a": "b"}}}, {"metadata": {}}, True),
+    "env value changed": ({"env": [{"name": "A", "value": ""}]}, {"env": [{"name": "A", "value": "x"}]}, True),
+    "env entry removed": ({"env": [{"name": "A", "value": "1"}]}, {"env": []}, True),
+    "cpu changed": ({"resources": {"limits": {"cpu": "0.5"}}}, {"resources": {"limits": {"cpu": "1"}}}, True),
+    "limit removed": ({"resources": {"limits": {"cpu": "1"}}}, {"resources": {}}, True),
+    "quantity-like string elsewhere": (
+        {"metadata": {"labels": {"v": "0.5"}}},
+        {"metadata": {"labels": {"v": "500m"}}},
+        True,
+    ),
+    "replicas scaled to zero": ({"spec": {"replicas": 1}}, {"spec": {"replicas": 0}}, True),
+}
+
+
+def main_() -> None:
+    failed = []
+    for case, (desired, live, drifted) in CASES.items():
+        if is_subset(desired, live) == drifted:
+            failed.append(case)
+            print(f"{case}: expected {'drift' if drifted else 'no drift'}")  # noqa: T201
+
+    if failed:
+        print(f"{len(failed)} of {len(CASES)} cases failed: {', '.join(failed)}")  # noqa: T201
+        sys.exit(1)
+    print(f"All {len(CASES)} cases passed")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main_()
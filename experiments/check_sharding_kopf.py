@@ -0,0 +1,176 @@
+"""Run two real kopf operators (main.py with sharding enabled) against one fake API server, and check no event is lost.
+
+Both replicas watch every StreamlitApp and handle only the ones they own, so this checks that a replica never records
+an app as handled for its owner. Every app's handlers must run for its creation, for a spec change made while its owner
+is still busy creating it, for a later change, and for a change made while its owner has crashed and the other replica
+has yet to take its apps over. Drift detection is off, so it cannot paper over a dropped event. The operators' requests
+are held to the chart's role.yaml.
+
+    python experiments/check_sharding_kopf.py --apps 40
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import kubernetes
+import yaml
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from fake_kube_api import FakeKubeApi, role_rules  # noqa: E402
+
+ROOT = Path(__file__).resolve().parents[1]
+ROLE_PATH = ROOT / "charts" / "streamlit-operator" / "templates" / "role.yaml"
+OPERATOR_TOKEN = "streamlit-operator"
+REPLICAS = ("replica-a", "replica-b")
+
+
+def write_kubeconfig(path: Path, host: str) -> None:
+    kubeconfig = {
+        "apiVersion": "v1",
+        "kind": "Config",
+        "clusters": [{"name": "fake", "cluster": {"server": host}}],
+        "users": [{"name": "operator", "user": {"token": OPERATOR_TOKEN}}],
+        "contexts": [{"name": "fake", "context": {"cluster": "fake", "user": "operator", "namespace": "streamlit"}}],
+        "current-context": "fake",
+    }
+    path.write_text(yaml.safe_dump(kubeconfig))
+
+
+def start_replica(identity: str, index: int, workdir: Path, log) -> subprocess.Popen:
+    config = {
+        "baseDnsRecord": "example.com",
+        "gitSyncAuthConfig": {"env": [], "volumeMounts": [], "volumes": []},
+        "metricsPort": 19090 + index,
+        "activatorPort": 18082 + index,
+        "driftDetection": {"enabled": False},
+        "sharding": {"enabled": True, "leaseDurationSeconds": 3, "renewIntervalSeconds": 1},
+    }
+    config_path = workdir / f"{identity}.yaml"
+    config_path.write_text(yaml.safe_dump(config))
+    env = {
+        **os.environ,
+        "KUBECONFIG": str(workdir / "kubeconfig"),
+        "STREAMLIT_OPERATOR_CONFIG": str(config_path),
+        "POD_NAME": identity,
+    }
+    command = [sys.executable, "-m", "kopf", "run", "--standalone", "--namespace=streamlit", "main.py"]
+    return subprocess.Popen(command, cwd=ROOT / "streamlit-operator", env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_for(description: str, condition: Callable[[], list[str]], timeout: float) -> list[str]:
+    """Wait until ``condition`` returns no failing app names, and return the last ones if it times out."""
+    deadline = time.monotonic() + timeout
+    while (failing := condition()) and time.monotonic() < deadline:
+        time.sleep(0.5)
+    print(f"{description}: {'ok' if not failing else f'{len(failing)} apps failed, e.g. {failing[:5]}'}")  # noqa: T201
+    return failing
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds each step may take")
+    parser.add_argument("--log", help="Keep the operators' output in this file")
+    args = parser.parse_args()
+
+    server = FakeKubeApi(latency_s=args.latency_ms / 1000, rbac={OPERATOR_TOKEN: role_rules(ROLE_PATH)}).start()
+    configuration = kubernetes.client.Configuration()
+    configuration.host = server.host
+    api = kubernetes.client.CustomObjectsApi(kubernetes.client.ApiClient(configuration))
+    core = kubernetes.client.CoreV1Api(kubernetes.client.ApiClient(configuration))
+    core.create_namespace({"apiVersion": "v1", "kind": "Namespace", "metadata": {"name": "streamlit"}})
+
+    def objects(plural: str) -> dict[str, dict]:
+        return {name: obj for (_, p, _, name), obj in list(server.objects.items()) if p == plural}
+
+    def handled_with_replicas(replicas: int) -> Callable[[], list[str]]:
+        """Apps whose handlers have not run for their latest spec, or whose Deployment is not at ``replicas``."""
+
+        def condition() -> list[str]:
+            apps, deployments = objects("streamlit-apps"), objects("deployments")
+            return [
+                name
+                for name in names
+                if apps[name].get("status", {}).get("observedGeneration") != apps[name]["metadata"]["generation"]
+                or deployments.get(name, {}).get("spec", {}).get("replicas") != replicas
+            ]
+
+        return condition
+
+    def set_replicas(replicas: int) -> None:
+        for name in names:
+            api.patch_namespaced_custom_object(
+                "fetch.com", "v1", "streamlit", "streamlit-apps", name, {"spec": {"replicas": replicas}}
+            )
+
+    names = [f"app-{i}" for i in range(args.apps)]
+    failed = []
+    with tempfile.TemporaryDirectory() as tmp, open(args.log or Path(tmp) / "operators.log", "w+") as log:
+        workdir = Path(tmp)
+        write_kubeconfig(workdir / "kubeconfig", server.host)
+        replicas = {identity: start_replica(identity, i, workdir, log) for i, identity in enumerate(REPLICAS)}
+        try:
+            members = wait_for(
+                "both replicas joined",
+                lambda: [i for i in REPLICAS if f"streamlit-operator-member-{i}" not in objects("leases")],
+                args.timeout,
+            )
+            if members:
+                failed.append("join")
+            time.sleep(2)  # Let kopf start watching after its startup handlers
+
+            for name in names:
+                api.create_namespaced_custom_object(
+                    "fetch.com",
+                    "v1",
+                    "streamlit",
+                    "streamlit-apps",
+                    {
+                        "apiVersion": "fetch.com/v1",
+                        "kind": "StreamlitApp",
+                        "metadata": {"name": name},
+                        "spec": {"repo": "https://github.com/example/monorepo.git", "ref": "main", "codeDir": name},
+                    },
+                )
+                # Before the owner is done creating it, while the other replica is idle
+                api.patch_namespaced_custom_object(
+                    "fetch.com", "v1", "streamlit", "streamlit-apps", name, {"spec": {"replicas": 2}}
+                )
+            if wait_for("created and updated right away", handled_with_replicas(2), args.timeout):
+                failed.append("create")
+
+            set_replicas(3)
+            if wait_for("updated", handled_with_replicas(3), args.timeout):
+                failed.append("update")
+
+            replicas.pop(REPLICAS[1]).kill()  # Keeps its member lease until it expires
+            set_replicas(4)
+            if wait_for("updated while a replica was down", handled_with_replicas(4), args.timeout):
+                failed.append("update while a replica was down")
+        finally:
+            for process in replicas.values():
+                process.terminate()
+            for process in replicas.values():
+                process.wait(30)
+            server.stop()
+            if failed:
+                log.seek(0)
+                errors = [line for line in log if "Traceback" in line or " ERROR " in line or "Forbidden" in line]
+                sys.stdout.writelines(errors[:20])
+
+    if failed:
+        print(f"FAILED: {', '.join(failed)}")  # noqa: T201
+        sys.exit(1)
+    print("All steps passed")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main_()
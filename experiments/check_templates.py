@@ -0,0 +1,136 @@
+"""Check that the templated children of a set of representative StreamlitApps are byte-identical to golden files.
+
+Every case runs through `main.template_children` (spec validation, resource profiles, templating and `kopf.adopt`) with
+its own operator config, and is compared against `experiments/golden/<case>.json`. Run with `--update` after an
+intended change to the templates, and review the diff of the golden files.
+
+    python experiments/check_templates.py
+    python experiments/check_templates.py --update
+"""
+
+import argparse
+import difflib
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "streamlit-operator"))
+
+import main  # noqa: E402
+from streamlit_operator_config import StreamlitOperatorConfig  # noqa: E402
+
+GOLDEN_DIR = Path(__file__).resolve().parent / "golden"
+
+BASE_CONFIG = {
+    "baseDnsRecord": "example.com",
+    "gitSyncAuthConfig": {
+        "env": [{"name": "GITSYNC_USERNAME", "valueFrom": {"secretKeyRef": {"name": "git-secret", "key": "username"}}}],
+        "volumeMounts": [{"name": "git-deploy-key", "mountPath": "/etc/git-secret", "readOnly": True}],
+        "volumes": [{"name": "git-deploy-key", "secret": {"secretName": "git-deploy-key", "defaultMode": 256}}],
+    },
+}
+# The chart's generated key, which every operator gets
+ACTIVITY_TOKEN_KEY = "0123456789abcdef0123456789abcdef"
+BASE_SPEC = {"repo": "https://github.com/example/monorepo.git", "ref": "main", "codeDir": "apps/dashboard"}
+
+# name -> (operator config overrides, spec overrides, asleep)
+CASES = {
+    "defaults": ({}, {}, False),
+    "no-sticky-sessions": ({}, {"stickySessions": False, "ingress": {"annotations": {"a": "b"}}}, False),
+    "autoscaling": (
+        {},
+        {
+            "autoscaling": {
+                "enabled": True,
+                "targetMemoryUtilizationPercentage": 70,
+                "customMetrics": [{"type": "Pods", "pods": {"metric": {"name": "sessions"}}}],
+            }
+        },
+        False,
+    ),
+    "asleep": ({}, {"idleScaling": {"enabled": True}}, True),
+    "default-resource-profile": ({"defaultResourceProfile": "small"}, {}, False),
+    "resources": (
+        {"defaultResourceProfile": "small"},
+        {"resources": {"profile": "large", "streamlit": {"limits": {"memory": "8Gi"}}}},
+        False,
+    ),
+    "full-checkout": ({}, {"codeDir": "/", "checkout": {"depth": 0, "sparse": False, "filter": None}}, False),
+    "extra-paths": (
+        {},
+        {"checkout": {"sparse": True, "filter": "blob:none", "extraPaths": ["libs/common", "apps"]}},
+        False,
+    ),
+    "restarted": ({}, {}, False),
+    "everything-enabled": (
+        {
+            "gitPoller": {"enabled": True},
+            "gitCache": {"enabled": True},
+            "dependencyCache": {"claimName": "streamlit-dependency-cache"},
+        },
+        {
+            "additionalLabels": {"team": "data"},
+            "additionalEnv": [{"name": "FOO", "value": "bar"}],
+            "additionalVolumes": [{"name": "extra", "emptyDir": {}}],
+            "additionalVolumeMounts": [{"name": "extra", "mountPath": "/extra"}],
+            "rollout": {"maxSurge": "25%", "startupTimeoutSeconds": 1200, "drainSeconds": 30},
+            "hotReload": False,
+        },
+        False,
+    ),
+}
+
+# Annotations of the StreamlitApp, by case
+OWNER_ANNOTATIONS = {"restarted": {"fetch.com/restartedAt": "2026-01-01T00:00:00+00:00"}}
+
+
+def render(config_overrides: dict, spec_overrides: dict, *, asleep: bool, owner_annotations: dict) -> str:
+    main.config = StreamlitOperatorConfig(**{**BASE_CONFIG, **config_overrides})
+    main.activity_token_key = ACTIVITY_TOKEN_KEY
+    name = "dashboard"
+    owner = {
+        "apiVersion": "fetch.com/v1",
+        "kind": "StreamlitApp",
+        "metadata": {
+            "name": name,
+            "namespace": "streamlit",
+            "uid": "00000000-0000-0000-0000-000000000000",
+            "annotations": owner_annotations,
+        },
+    }
+    spec = main.parse_spec({**BASE_SPEC, **spec_overrides})
+    children = main.template_children(name, spec, main.make_dns_name(name), owner, asleep=asleep)
+    return json.dumps(children, indent=2) + "\n"
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--update", action="store_true", help="Rewrite the golden files instead of checking them")
+    args = parser.parse_args()
+
+    failed = []
+    for case, (config_overrides, spec_overrides, asleep) in CASES.items():
+        path = GOLDEN_DIR / f"{case}.json"
+        rendered = render(
+            config_overrides, spec_overrides, asleep=asleep, owner_annotations=OWNER_ANNOTATIONS.get(case, {})
+        )
+        if args.update:
+            GOLDEN_DIR.mkdir(exist_ok=True)
+            path.write_text(rendered)
+            continue
+        golden = path.read_text() if path.exists() else ""
+        if rendered != golden:
+            failed.append(case)
+            sys.stdout.writelines(difflib.unified_diff(golden.splitlines(True), rendered.splitlines(True), str(path)))
+
+    if args.update:
+        print(f"Updated {len(CASES)} golden files in {GOLDEN_DIR}")  # noqa: T201
+    elif failed:
+        print(f"{len(failed)} of {len(CASES)} cases differ from their golden files: {', '.join(failed)}")  # noqa: T201
+        sys.exit(1)
+    else:
+        print(f"All {len(CASES)} cases match their golden files")  # noqa: T201
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,362 @@
+"""A tiny in-memory stand-in for the Kubernetes API server, for local benchmarks.
+
+Only implements what the operator, kopf and the hub touch: API discovery of the resources in ``DISCOVERY``, and
+create/get/list/watch/replace/patch/delete of namespaced and cluster-scoped objects, with equality label selectors,
+resourceVersion conflicts and dry runs.
+Every resource has a status subresource: the status is only written through ``.../{name}/status``. Requests carrying
+one of the ``rbac`` bearer tokens are limited to that token's RBAC rules (see ``role_rules``) and get a 403 otherwise,
+so a missing grant in the chart fails here as it would in a cluster; requests without a token are not restricted.
+Every request can be delayed by a fixed latency to mimic a real API server round trip.
+"""
+
+import asyncio
+import copy
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+
+import yaml
+from aiohttp import web
+
+# /api/v1/namespaces/{ns}/{plural}[/{name}] and /apis/{group}/{version}/namespaces/{ns}/{plural}[/{name}], then the
+# cluster-scoped /api/v1/{plural}[/{name}] and /apis/{group}/{version}/{plural}[/{name}] (matched in this order)
+ROUTES = [
+    "/api/{version}/namespaces/{namespace}/{plural}",
+    "/api/{version}/namespaces/{namespace}/{plural}/{name}",
+    "/apis/{group}/{version}/namespaces/{namespace}/{plural}",
+    "/apis/{group}/{version}/namespaces/{namespace}/{plural}/{name}",
+    "/api/{version}/namespaces/{namespace}/{plural}/{name}/status",
+    "/apis/{group}/{version}/namespaces/{namespace}/{plural}/{name}/status",
+    "/api/{version}/{plural}",
+    "/api/{version}/{plural}/{name}",
+    "/apis/{group}/{version}/{plural}",
+    "/apis/{group}/{version}/{plural}/{name}",
+]
+DISCOVERY_ROUTES = ["/version", "/api", "/apis", "/api/{version}", "/apis/{group}/{version}"]
+# (group, version) -> (plural, kind, namespaced) of the resources served for discovery
+DISCOVERY = {
+    ("", "v1"): [
+        ("pods", "Pod", True),
+        ("services", "Service", True),
+        ("events", "Event", True),
+        ("persistentvolumeclaims", "PersistentVolumeClaim", True),
+        ("namespaces", "Namespace", False),
+    ],
+    ("apps", "v1"): [("deployments", "Deployment", True)],
+    ("networking.k8s.io", "v1"): [("ingresses", "Ingress", True)],
+    ("autoscaling", "v2"): [("horizontalpodautoscalers", "HorizontalPodAutoscaler", True)],
+    ("coordination.k8s.io", "v1"): [("leases", "Lease", True)],
+    ("fetch.com", "v1"): [("streamlit-apps", "StreamlitApp", True)],
+    ("apiextensions.k8s.io", "v1"): [("customresourcedefinitions", "CustomResourceDefinition", False)],
+}
+VERBS = ["create", "delete", "get", "list", "patch", "update", "watch"]
+METHOD_VERBS = {"POST": "create", "PUT": "update", "PATCH": "patch", "DELETE": "delete"}
+
+
+def role_rules(path: str) -> list[dict]:
+    """The rules of every Role and ClusterRole in a manifest file without templating, like the chart's role.yaml."""
+    with open(path) as f:
+        documents = [doc for doc in yaml.safe_load_all(f) if doc]
+    return [rule for doc in documents if doc.get("kind") in ("Role", "ClusterRole") for rule in doc.get("rules", [])]
+
+
+class FakeKubeApi:
+    def __init__(self, latency_s: float = 0.0, port: int = 0, rbac: dict[str, list[dict]] | None = None):
+        self.latency_s = latency_s
+        self.rbac = rbac or {}  # bearer token -> RBAC rules
+        self.port = port
+        self.objects: dict[tuple, dict] = {}
+        self.calls: Counter = Counter()
+        self._resource_version = itertools.count(1)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._runner: web.AppRunner | None = None
+        self._started = threading.Event()
+        self._events: list[tuple[int, tuple, dict]] = []  # (resourceVersion, (group, plural, namespace), event)
+        self._watchers: list[tuple[tuple, asyncio.Queue]] = []
+        self._stopping = False
+
+    @property
+    def host(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def _key(self, request: web.Request) -> tuple:
+        info = request.match_info
+        return (info.get("group", ""), info["plural"], info.get("namespace", ""), info.get("name"))
+
+    def _forbidden(self, request: web.Request) -> web.Response | None:
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if token not in self.rbac:
+            return None
+        info = request.match_info
+        group = info.get("group", "")
+        resource = info["plural"] + ("/status" if request.path.endswith("/status") else "")
+        if request.method == "GET":
+            watch = request.query.get("watch") in ("true", "True", "1")
+            verb = "get" if info.get("name") else "watch" if watch else "list"
+        else:
+            verb = METHOD_VERBS.get(request.method, request.method.lower())
+        for rule in self.rbac[token]:
+            if (
+                {group, "*"} & set(rule.get("apiGroups", []))
+                and {resource, "*"} & set(rule.get("resources", []))
+                and {verb, "*"} & set(rule.get("verbs", []))
+            ):
+                return None
+        message = f'cannot {verb} resource "{resource}" in API group "{group}"'
+        return self._status(403, "Forbidden", message)
+
+    def _stamp(self, obj: dict, previous: dict | None = None) -> dict:
+        metadata = obj.setdefault("metadata", {})
+        metadata.setdefault("uid", str(uuid.uuid4()))
+        metadata.setdefault("creationTimestamp", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+        metadata["resourceVersion"] = str(next(self._resource_version))
+        # Like the real server, only a change to the spec is a new generation, not one to the metadata
+        if previous is None:
+            metadata["generation"] = metadata.get("generation", 0) + 1
+        else:
+            generation = previous["metadata"].get("generation", 0)
+            metadata["generation"] = generation + (obj.get("spec") != previous.get("spec"))
+        return obj
+
+    def _notify(self, key: tuple, event_type: str, obj: dict) -> None:
+        resource = key[:3]
+        event = {"type": event_type, "object": copy.deepcopy(obj)}
+        self._events.append((int(obj["metadata"]["resourceVersion"]), resource, event))
+        for watched, queue in self._watchers:
+            if watched == resource:
+                queue.put_nowait(event)
+
+    async def _watch(self, request: web.Request, resource: tuple) -> web.StreamResponse:
+        since = int(request.query.get("resourceVersion") or 0)
+        timeout = float(request.query.get("timeoutSeconds", 300))
+        queue: asyncio.Queue = asyncio.Queue()
+        for rv, watched, event in self._events:
+            if watched == resource and rv > since:
+                queue.put_nowait(event)
+        entry = (resource, queue)
+        self._watchers.append(entry)
+
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        deadline = time.monotonic() + timeout
+        try:
+            while not self._stopping and (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    event = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if event is None:  # The server is stopping
+                    break
+                await response.write(json.dumps(event).encode() + b"\n")
+        except ConnectionResetError:  # The client went away, e.g. an operator replica stopped
+            pass
+        finally:
+            self._watchers.remove(entry)
+        return response
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.calls[request.method] += 1
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        if (forbidden := self._forbidden(request)) is not None:
+            return forbidden
+
+        group, plural, namespace, name = self._key(request)
+        body = await request.json() if request.can_read_body else None
+
+        if request.method == "GET" and name is None and request.query.get("watch") in ("true", "True", "1"):
+            return await self._watch(request, (group, plural, namespace))
+
+        if request.method == "GET" and name is None:
+            selector = dict(
+                term.split("=", 1) for term in request.query.get("labelSelector", "").split(",") if "=" in term
+            )
+            items = [
+                copy.deepcopy(obj)
+                for (g, p, ns, _), obj in self.objects.items()
+                if (g, p, ns) == (group, plural, namespace)
+                and selector.items() <= obj["metadata"].get("labels", {}).items()
+            ]
+            resource_version = str(self._events[-1][0]) if self._events else "0"
+            return web.json_response({"metadata": {"resourceVersion": resource_version}, "items": items})
+
+        # Dry-run writes are answered as usual but not persisted
+        dry_run = bool(request.query.get("dryRun")) or (isinstance(body, dict) and bool(body.get("dryRun")))
+
+        if request.method == "POST":
+            if "name" not in body["metadata"]:
+                body["metadata"]["name"] = body["metadata"]["generateName"] + uuid.uuid4().hex[:5]
+            name = body["metadata"]["name"]
+            key = (group, plural, namespace, name)
+            if key in self.objects:
+                return self._status(409, "AlreadyExists", f"{plural} {name!r} already exists")
+            body["metadata"]["namespace"] = namespace
+            if dry_run:
+                return web.json_response(body, status=201)
+            self.objects[key] = self._stamp(body)
+            self._notify(key, "ADDED", body)
+            return web.json_response(body, status=201)
+
+        key = (group, plural, namespace, name)
+        if request.path.endswith("/status") and request.method in ("PATCH", "PUT"):
+            if key not in self.objects:
+                return self._status(404, "NotFound", f"{plural} {name!r} not found")
+            status = (body or {}).get("status")
+            if request.method == "PATCH" and isinstance(self.objects[key].get("status"), dict):
+                status = _merge(self.objects[key]["status"], status or {})
+            # A status write does not change the object's generation
+            obj = {**self.objects[key], "status": status}
+            obj["metadata"] = {**obj["metadata"], "resourceVersion": str(next(self._resource_version))}
+            self.objects[key] = obj
+            self._notify(key, "MODIFIED", self.objects[key])
+            return web.json_response(self.objects[key])
+        # Writes to the object itself leave its status alone
+        if isinstance(body, dict) and request.method in ("PUT", "PATCH"):
+            body.pop("status", None)
+            if key in self.objects and "status" in self.objects[key] and request.method == "PUT":
+                body["status"] = self.objects[key]["status"]
+
+        if request.method == "PATCH" and request.content_type == "application/apply-patch+yaml":
+            # Server-side apply: create if missing, otherwise take the applied configuration as the new object
+            body["metadata"]["namespace"] = namespace
+            if key in self.objects and _without_server_fields(self.objects[key]) == body:
+                return web.json_response(self.objects[key])
+            if key in self.objects and "status" in self.objects[key]:
+                body["status"] = self.objects[key]["status"]
+            self._notify(key, "MODIFIED" if key in self.objects else "ADDED", self._stamp(body, self.objects.get(key)))
+            self.objects[key] = body
+            return web.json_response(body)
+
+        if key not in self.objects:
+            return self._status(404, "NotFound", f"{plural} {name!r} not found")
+
+        if request.method == "GET":
+            return web.json_response(self.objects[key])
+        # Writes carrying a resourceVersion only succeed against that exact version (optimistic concurrency)
+        expected_version = (body or {}).get("metadata", {}).get("resourceVersion") if isinstance(body, dict) else None
+        if expected_version and expected_version != self.objects[key]["metadata"]["resourceVersion"]:
+            return self._status(409, "Conflict", f"{plural} {name!r} has been modified")
+        if request.method == "PUT":
+            body["metadata"]["namespace"] = namespace
+            self.objects[key] = self._stamp(body, self.objects[key])
+            self._notify(key, "MODIFIED", body)
+            return web.json_response(body)
+        if request.method == "PATCH" and dry_run:
+            return web.json_response(_merge(self.objects[key], body) if isinstance(body, dict) else self.objects[key])
+        if request.method == "PATCH":
+            if isinstance(body, dict):
+                self.objects[key] = self._stamp(_merge(self.objects[key], body), self.objects[key])
+                self._notify(key, "MODIFIED", self.objects[key])
+            return web.json_response(self.objects[key])
+        if request.method == "DELETE" and dry_run:
+            return web.json_response(self.objects[key])
+        if request.method == "DELETE":
+            obj = self.objects.pop(key)
+            obj["metadata"]["resourceVersion"] = str(next(self._resource_version))
+            self._notify(key, "DELETED", obj)
+            return web.json_response(obj)
+        return self._status(405, "MethodNotAllowed", request.method)
+
+    async def _discover(self, request: web.Request) -> web.Response:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        info = request.match_info
+        if request.path == "/version":
+            return web.json_response({"major": "1", "minor": "28", "gitVersion": "v1.28.0"})
+        if request.path == "/api":
+            return web.json_response({"kind": "APIVersions", "versions": ["v1"]})
+        if request.path == "/apis":
+            groups = [
+                {
+                    "name": group,
+                    "versions": [{"groupVersion": f"{group}/{version}", "version": version}],
+                    "preferredVersion": {"groupVersion": f"{group}/{version}", "version": version},
+                }
+                for group, version in DISCOVERY
+                if group
+            ]
+            return web.json_response({"kind": "APIGroupList", "groups": groups})
+        resources = DISCOVERY.get((info.get("group", ""), info["version"]))
+        if resources is None:
+            return self._status(404, "NotFound", request.path)
+        return web.json_response(
+            {
+                "kind": "APIResourceList",
+                "resources": [
+                    resource
+                    for plural, kind, namespaced in resources
+                    for resource in (
+                        {
+                            "name": plural,
+                            "singularName": kind.lower(),
+                            "namespaced": namespaced,
+                            "kind": kind,
+                            "verbs": VERBS,
+                        },
+                        {
+                            "name": f"{plural}/status",
+                            "singularName": "",
+                            "namespaced": namespaced,
+                            "kind": kind,
+                            "verbs": ["get", "patch", "update"],
+                        },
+                    )
+                ],
+            }
+        )
+
+    @staticmethod
+    def _status(code: int, reason: str, message: str) -> web.Response:
+        body = {"kind": "Status", "apiVersion": "v1", "status": "Failure", "reason": reason, "message": message}
+        return web.Response(status=code, text=json.dumps(body), content_type="application/json")
+
+    def start(self) -> "FakeKubeApi":
+        threading.Thread(target=self._serve, daemon=True).start()
+        self._started.wait()
+        return self
+
+    def stop(self) -> None:
+        if self._loop and self._runner:
+            # End the open watches (and those clients reopen) first, rather than waiting out the shutdown timeout
+            self._stopping = True
+            for _, queue in list(self._watchers):
+                self._loop.call_soon_threadsafe(queue.put_nowait, None)
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+
+    def _serve(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        app = web.Application(client_max_size=16 * 1024**2)
+        for route in DISCOVERY_ROUTES:
+            app.router.add_get(route, self._discover)
+        for route in ROUTES:
+            app.router.add_route("*", route, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+
+
+def _without_server_fields(obj: dict) -> dict:
+    obj = copy.deepcopy(obj)
+    for field in ("uid", "creationTimestamp", "resourceVersion", "generation"):
+        obj["metadata"].pop(field, None)
+    obj.pop("status", None)
+    return obj
+
+
+def _merge(current: dict, patch: dict) -> dict:
+    merged = copy.deepcopy(current)
+    for k, v in patch.items():
+        if v is None:
+            merged.pop(k, None)
+        elif isinstance(v, dict) and isinstance(merged.get(k), dict):
+            merged[k] = _merge(merged[k], v)
+        else:
+            merged[k] = v
+    return merged
@@ -0,0 +1,307 @@
+"""Load test the operator's handlers and the hub client together against a local fake API server.
+
+The hub's `StappClient` creates, restarts and deletes StreamlitApps at a fixed rate, one phase after another, while the
+real `create_fn` and `update_fn` reconcile them from a watch of the apps, as kopf would: the events of each app are
+handled one at a time (the latest of a burst only), events that only touch the status are skipped, and each handler's
+result and status patch are written back to the app's status. Latency runs from when an event was due to be sent until
+the operator has handled it (or, for deletes, seen it), so a harness falling behind its rate shows up as latency too.
+
+The operator's requests are held to the RBAC rules of the chart's role.yaml, and after the create phase every app must
+have the status its handler wrote (through the status subresource). kopf's own bookkeeping (progress annotations,
+finalizers, peering) is not included in the API call counts, and the fake server has no garbage collector, so the
+children of deleted apps stay around. The fake server, the hub and the
+operator share one process (and its GIL), so once it runs out of CPU the throughput is a lower bound.
+
+    python experiments/load_test.py --apps 2000 --rate 200 --latency-ms 5 --concurrency 20
+    python experiments/load_test.py --apps 500 --rate 100 --max-p99-ms 500 --max-calls-per-app 10
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import kopf
+import kubernetes
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "streamlit-operator"))
+# Appended, since the hub has a main.py of its own
+sys.path.append(str(Path(__file__).resolve().parents[1] / "streamlit-hub"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import main  # noqa: E402
+from app_status import AppStatusWriter  # noqa: E402
+from fake_kube_api import FakeKubeApi, role_rules  # noqa: E402
+from kube_clients import KubeClients  # noqa: E402
+from stapp_client import StappClient, build_app_rows  # noqa: E402
+from streamlit_operator_config import StreamlitOperatorConfig  # noqa: E402
+
+logger = logging.getLogger("load-test")
+
+PHASES = ("create", "update", "delete")
+HUB_CONVERGE_TIMEOUT_SECONDS = 60
+ROLE_PATH = Path(__file__).resolve().parents[1] / "charts" / "streamlit-operator" / "templates" / "role.yaml"
+# Bearer token of the operator's requests, which the fake server holds to the operator's RBAC rules
+OPERATOR_TOKEN = "streamlit-operator"
+
+
+class Operator:
+    """Feeds the watch events of the StreamlitApps to the handlers of main.py, one worker per app like kopf."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._queues: dict[str, asyncio.Queue] = {}
+        self._workers: set[asyncio.Task] = set()
+        self._handled_essence: dict[str, str] = {}
+        self._written_status: dict[str, dict] = {}
+        self._live_status: dict[str, dict] = {}
+        self.pending: dict[str, dict[str, list[float]]] = {phase: {} for phase in PHASES}
+        self.latencies: dict[str, list[float]] = {phase: [] for phase in PHASES}
+        self.errors: Counter = Counter()
+        self.done = asyncio.Event()
+
+    def expect(self, phase: str, name: str, due: float) -> None:
+        self.pending[phase].setdefault(name, []).append(due)
+
+    def _resolve(self, phase: str, name: str) -> None:
+        now = time.perf_counter()
+        self.latencies[phase].extend(now - due for due in self.pending[phase].pop(name, []))
+        if not any(self.pending.values()):
+            self.done.set()
+
+    def _fail(self, name: str) -> None:
+        """Stop waiting for a failed app's events, which are reported as errors instead of latencies."""
+        for phase in ("create", "update"):
+            self.pending[phase].pop(name, None)
+        if not any(self.pending.values()):
+            self.done.set()
+
+    def watch(self, api: kubernetes.client.CustomObjectsApi) -> None:
+        """Run in a thread: stream the app events into the event loop."""
+        w = kubernetes.watch.Watch()
+        try:
+            for event in w.stream(api.list_namespaced_custom_object, "fetch.com", "v1", "streamlit", "streamlit-apps"):
+                self._loop.call_soon_threadsafe(self._dispatch, event["type"], event["raw_object"])
+        except Exception:
+            logger.exception("Watch of the StreamlitApps failed")
+
+    def live_status(self, name: str) -> dict:
+        """The status of ``name`` as last seen by the watch, like the operator's index of the apps."""
+        return self._live_status.get(name, {})
+
+    def _dispatch(self, event_type: str, body: dict) -> None:
+        name = body["metadata"]["name"]
+        self._live_status[name] = body.get("status") or {}
+        if name not in self._queues:
+            self._queues[name] = asyncio.Queue()
+            worker = asyncio.create_task(self._work(name))
+            self._workers.add(worker)
+            worker.add_done_callback(self._workers.discard)
+        self._queues[name].put_nowait((event_type, body))
+
+    async def _work(self, name: str) -> None:
+        queue = self._queues[name]
+        while True:
+            event_type, body = await queue.get()
+            while not queue.empty():  # Only the latest state of a burst of events is handled
+                event_type, body = queue.get_nowait()
+            if event_type == "DELETED":
+                del self._queues[name]
+                self._handled_essence.pop(name, None)
+                self._written_status.pop(name, None)
+                self._resolve("delete", name)
+                return
+            try:
+                await self._handle(name, body)
+            except Exception:
+                logger.exception("Error handling %s", name)
+                self.errors[name] += 1
+                self._fail(name)
+
+    async def _handle(self, name: str, body: dict) -> None:
+        # Like kopf's "essence": what update handlers react to, so status patches (ours included) are skipped
+        metadata = body["metadata"]
+        essence = json.dumps([body.get("spec"), metadata.get("labels"), metadata.get("annotations")], sort_keys=True)
+        previous = self._handled_essence.get(name)
+        if essence == previous:
+            return
+
+        status = {**(body.get("status") or {}), **self._written_status.get(name, {})}
+        patch = kopf.Patch()
+        kwargs = {"spec": body["spec"], "namespace": "streamlit", "body": body, "patch": patch, "logger": logger}
+        if previous is None and "manifestHashes" not in status:
+            await main.create_fn(name=name, **kwargs)
+            phase = "create"
+        else:
+            await main.update_fn(name=name, status=status, **kwargs)
+            phase = "update"
+        status_patch = dict(patch.get("status", {}))
+        self._handled_essence[name] = essence
+
+        if status_patch:
+            self._written_status[name] = {**self._written_status.get(name, {}), **status_patch}
+            await main.patch_app_status(name, status_patch)
+        self._resolve(phase, name)
+
+
+async def run_phase(
+    phase: str,
+    names: list[str],
+    rate: float,
+    operator: Operator,
+    hub: StappClient,
+    executor: ThreadPoolExecutor,
+) -> float:
+    """Send one event per name at ``rate`` per second and wait for the operator to handle all of them."""
+    loop = asyncio.get_running_loop()
+    operator.done.clear()
+    send = {
+        "create": lambda name: hub.create_streamlit_app(name, "https://github.com/example/monorepo.git", "main", name),
+        "update": hub.restart_streamlit_app,
+        "delete": hub.delete_streamlit_app,
+    }[phase]
+
+    start = time.perf_counter()
+    sends = []
+    for i, name in enumerate(names):
+        due = start + i / rate
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        operator.expect(phase, name, due)
+        sends.append(loop.run_in_executor(executor, send, name))
+    await asyncio.gather(*sends)
+    await operator.done.wait()
+    return time.perf_counter() - start
+
+
+async def wait_for_hub(hub: StappClient, expected: int) -> float:
+    start = time.perf_counter()
+    while len(hub.app_rows()) != expected:
+        if time.perf_counter() - start > HUB_CONVERGE_TIMEOUT_SECONDS:
+            raise TimeoutError(f"The hub shows {len(hub.app_rows())} apps, expected {expected}")
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - start
+
+
+def check_statuses(server: FakeKubeApi, names: list[str]) -> None:
+    """Raise unless every app has the status written by its create handler."""
+    statuses = {
+        name: server.objects[("fetch.com", "streamlit-apps", "streamlit", name)].get("status") for name in names
+    }
+    missing = [name for name, status in statuses.items() if "manifestHashes" not in (status or {})]
+    if missing:
+        raise RuntimeError(f"{len(missing)} apps have no status written by their handler, e.g. {missing[0]}")
+
+
+def percentile(values: list[float], q: float) -> float:
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+
+async def run(args: argparse.Namespace, server: FakeKubeApi) -> list[dict]:
+    main.kube = KubeClients(args.concurrency)
+    hub_configuration = kubernetes.client.Configuration.get_default_copy()
+    hub_configuration.connection_pool_maxsize = args.hub_workers + 2  # And one connection per informer
+    hub_configuration.api_key = {}  # The hub is not bound by the operator's role
+    hub_api_client = kubernetes.client.ApiClient(hub_configuration)
+    hub = StappClient(hub_api_client)
+    operator = Operator(asyncio.get_running_loop())
+    main.app_status = AppStatusWriter(
+        main.patch_app_status, operator.live_status, main.config.statusUpdates.debounceSeconds
+    )
+    threading.Thread(target=operator.watch, args=(main.kube.custom,), daemon=True).start()
+
+    names = [f"app-{i}" for i in range(args.apps)]
+    results = []
+    with ThreadPoolExecutor(max_workers=args.hub_workers, thread_name_prefix="hub") as executor:
+        for phase in PHASES:
+            calls_before = server.calls.copy()
+            elapsed = await run_phase(phase, names, args.rate, operator, hub, executor)
+            calls = server.calls - calls_before
+            if operator.errors:
+                raise RuntimeError(f"Handler errors for {len(operator.errors)} apps: {dict(operator.errors)}")
+            hub_lag = await wait_for_hub(hub, 0 if phase == "delete" else args.apps)
+            results.append(
+                {
+                    "phase": phase,
+                    "events": len(names),
+                    "seconds": elapsed,
+                    "latencies": operator.latencies[phase],
+                    "calls": calls,
+                    "hub_lag": hub_lag,
+                }
+            )
+            if phase == "create":
+                apps = hub.apps_informer.items()
+                start = time.perf_counter()
+                build_app_rows(apps, hub.pods_informer.items())
+                hub_rows_ms = (time.perf_counter() - start) * 1000
+                check_statuses(server, names)
+
+    main.kube.close()
+    print(f"hub: app_rows rebuild for {args.apps} apps took {hub_rows_ms:.1f} ms")  # noqa: T201
+    return results
+
+
+def main_() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--apps", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=100.0, help="Events sent per second in each phase")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Added to every request to the fake API")
+    parser.add_argument("--concurrency", type=int, default=20, help="The operator's maxConcurrentReconciles")
+    parser.add_argument("--hub-workers", type=int, default=16, help="Threads sending the hub's requests")
+    parser.add_argument("--max-p99-ms", type=float, help="Exit with an error if any phase's p99 latency is higher")
+    parser.add_argument("--max-calls-per-app", type=float, help="Exit with an error if any phase makes more calls")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    main.config = StreamlitOperatorConfig(
+        baseDnsRecord="example.com",
+        maxConcurrentReconciles=args.concurrency,
+        gitSyncAuthConfig={"env": [], "volumeMounts": [], "volumes": []},
+    )
+    server = FakeKubeApi(latency_s=args.latency_ms / 1000, rbac={OPERATOR_TOKEN: role_rules(ROLE_PATH)}).start()
+    configuration = kubernetes.client.Configuration()
+    configuration.host = server.host
+    configuration.api_key = {"authorization": OPERATOR_TOKEN}
+    configuration.api_key_prefix = {"authorization": "Bearer"}
+    kubernetes.client.Configuration.set_default(configuration)
+    try:
+        results = asyncio.run(run(args, server))
+    finally:
+        # The hub's informers and the operator's watch keep reconnecting to the stopped server, which is expected
+        logging.disable(logging.CRITICAL)
+        server.stop()
+
+    print(  # noqa: T201
+        f"{'phase':<7} {'events':>6} {'seconds':>8} {'events/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+        f"{'calls/app':>9}  {'hub lag s':>9}  calls by method"
+    )
+    failed = []
+    for result in results:
+        latencies_ms = [latency * 1000 for latency in result["latencies"]]
+        p99 = percentile(latencies_ms, 99)
+        calls_per_app = sum(result["calls"].values()) / result["events"]
+        by_method = " ".join(f"{method}={count}" for method, count in sorted(result["calls"].items()))
+        print(  # noqa: T201
+            f"{result['phase']:<7} {result['events']:>6} {result['seconds']:>8.2f} "
+            f"{result['events'] / result['seconds']:>9.1f} {percentile(latencies_ms, 50):>8.1f} {p99:>8.1f} "
+            f"{max(latencies_ms):>8.1f} {calls_per_app:>9.2f}  {result['hub_lag']:>9.2f}  {by_method}"
+        )
+        if args.max_p99_ms is not None and p99 > args.max_p99_ms:
+            failed.append(f"{result['phase']} p99 {p99:.1f} ms > {args.max_p99_ms} ms")
+        if args.max_calls_per_app is not None and calls_per_app > args.max_calls_per_app:
+            failed.append(f"{result['phase']} {calls_per_app:.2f} calls per app > {args.max_calls_per_app}")
+
+    if failed:
+        print("FAILED: " + "; ".join(failed))  # noqa: T201
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_()
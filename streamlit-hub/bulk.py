@@ -0,0 +1,252 @@
+"""Create, update and delete many StreamlitApps at once, from a YAML or JSONL file of app specs.
+
+Each item is either ``{"name": ..., "spec": {...}}`` or a full StreamlitApp manifest; YAML files may hold a list of
+items or one item per document. ``apply`` creates the apps that don't exist yet and merges the given spec into the
+ones that do, so a file of ``{"name": ..., "spec": {"repo": ...}}`` items rotates the repo of just those apps. Every
+item is validated against StreamlitAppSpec before it is sent, and ``--dry-run`` has the API server validate it too
+without persisting anything.
+
+    python streamlit-hub/bulk.py apply apps.yaml --dry-run
+    python streamlit-hub/bulk.py apply apps.jsonl --defaults team-defaults.yaml --workers 16 --report report.jsonl
+    python streamlit-hub/bulk.py delete apps.yaml
+"""
+
+import argparse
+import dataclasses
+import json
+import logging
+import os
+import sys
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pydantic
+import yaml
+from kubernetes import client, config
+from kubernetes.client.rest import ApiException
+from stapp_client import deep_update
+
+# The spec schema lives with the operator, which is checked out next to the hub
+sys.path.append(str(Path(__file__).resolve().parents[1] / "streamlit-operator"))
+from streamlit_app_spec_schema import make_streamlit_app_manifest
+
+logger = logging.getLogger(__name__)
+
+GROUP = "fetch.com"
+VERSION = "v1"
+NAMESPACE = "streamlit"
+PLURAL = "streamlit-apps"
+
+DEFAULT_WORKERS = 8
+
+
+@dataclasses.dataclass
+class BulkItem:
+    name: str
+    spec: dict = dataclasses.field(default_factory=dict)
+    error: str | None = None  # Why the item is invalid, reported for it instead of processing it
+
+
+@dataclasses.dataclass
+class BulkResult:
+    name: str
+    action: str  # created, updated, unchanged, deleted, not-found, invalid or failed
+    dry_run: bool
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.action not in ("invalid", "failed")
+
+
+def load_items(text: str, *, jsonl: bool = False) -> list[BulkItem]:
+    """Parse the items of a file, keeping malformed ones as invalid items so they are reported along with the rest."""
+    if jsonl:
+        documents = []
+        for number, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                documents.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                documents.append(BulkItem("", error=f"Line {number} is not valid JSON: {e}"))
+    else:
+        documents = [doc for doc in yaml.safe_load_all(text) if doc is not None]
+    raw_items = [item for doc in documents for item in (doc if isinstance(doc, list) else [doc])]
+    return [item if isinstance(item, BulkItem) else _parse_item(item) for item in raw_items]
+
+
+def _parse_item(item) -> BulkItem:
+    if not isinstance(item, dict):
+        return BulkItem("", error="Item is not a mapping")
+    metadata = item.get("metadata") or {}
+    name = item.get("name") or (metadata.get("name") if isinstance(metadata, dict) else None)
+    spec = item.get("spec") or {}
+    if not name:
+        return BulkItem("", error="Item has no name")
+    if not isinstance(name, str):
+        return BulkItem(str(name), error="Item name is not a string")
+    if not isinstance(spec, dict):
+        return BulkItem(name, error="Item spec is not a mapping")
+    return BulkItem(name, spec)
+
+
+def load_items_file(path: str) -> list[BulkItem]:
+    return load_items(Path(path).read_text(), jsonl=path.endswith(".jsonl"))
+
+
+def apply_streamlit_apps(
+    api: client.CustomObjectsApi,
+    items: Iterable[BulkItem],
+    *,
+    defaults: dict | None = None,
+    dry_run: bool = False,
+    workers: int = DEFAULT_WORKERS,
+) -> list[BulkResult]:
+    """Create or update every item concurrently, with ``defaults`` deep-merged under the spec of newly created apps."""
+    return _run_bulk(items, lambda item: _apply_one(api, item, defaults or {}, dry_run=dry_run), workers, dry_run)
+
+
+def delete_streamlit_apps(
+    api: client.CustomObjectsApi,
+    items: Iterable[BulkItem],
+    *,
+    dry_run: bool = False,
+    workers: int = DEFAULT_WORKERS,
+) -> list[BulkResult]:
+    return _run_bulk(items, lambda item: _delete_one(api, item, dry_run=dry_run), workers, dry_run)
+
+
+def _run_bulk(
+    items: Iterable[BulkItem],
+    fn: Callable[[BulkItem], BulkResult],
+    workers: int,
+    dry_run: bool,  # noqa: FBT001
+) -> list[BulkResult]:
+    items = list(items)
+    seen = set()
+
+    def run(item: BulkItem) -> BulkResult:
+        try:
+            return fn(item)
+        except pydantic.ValidationError as e:
+            return BulkResult(item.name, "invalid", dry_run, str(e))
+        except ApiException as e:
+            # 422 is the API server rejecting the object itself, anything else is worth a retry
+            return BulkResult(item.name, "invalid" if e.status == 422 else "failed", dry_run, _api_error_message(e))
+        except Exception as e:
+            logger.exception("Error processing %s", item.name)
+            return BulkResult(item.name, "failed", dry_run, str(e))
+
+    results: dict[int, BulkResult] = {}
+    todo = []
+    for index, item in enumerate(items):
+        if item.error:
+            results[index] = BulkResult(item.name, "invalid", dry_run, item.error)
+        elif not item.name:
+            results[index] = BulkResult("", "invalid", dry_run, "Item has no name")
+        elif item.name in seen:
+            results[index] = BulkResult(item.name, "invalid", dry_run, "Duplicate of an earlier item")
+        else:
+            seen.add(item.name)
+            todo.append(index)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bulk") as executor:
+        results.update(zip(todo, executor.map(run, (items[index] for index in todo)), strict=True))
+    return [results[index] for index in range(len(items))]
+
+
+def _apply_one(api: client.CustomObjectsApi, item: BulkItem, defaults: dict, *, dry_run: bool) -> BulkResult:
+    dry_run_param = {"dry_run": "All"} if dry_run else {}
+    try:
+        current = api.get_namespaced_custom_object(GROUP, VERSION, NAMESPACE, PLURAL, item.name)
+    except ApiException as e:
+        if e.status != 404:
+            raise
+        current = None
+
+    if current is None:
+        manifest = make_streamlit_app_manifest(item.name, exclude_unset=True, **deep_update(defaults, item.spec))
+        api.create_namespaced_custom_object(GROUP, VERSION, NAMESPACE, PLURAL, manifest, **dry_run_param)
+        return BulkResult(item.name, "created", dry_run)
+
+    spec = deep_update(current.get("spec", {}), item.spec)
+    make_streamlit_app_manifest(item.name, **spec)  # Validate the merged spec
+    if spec == current.get("spec", {}):
+        return BulkResult(item.name, "unchanged", dry_run)
+    # A JSON merge patch of the item's spec merges it into the current spec just like deep_update did above
+    api.patch_namespaced_custom_object(
+        GROUP, VERSION, NAMESPACE, PLURAL, item.name, {"spec": item.spec}, **dry_run_param
+    )
+    return BulkResult(item.name, "updated", dry_run)
+
+
+def _delete_one(api: client.CustomObjectsApi, item: BulkItem, *, dry_run: bool) -> BulkResult:
+    try:
+        api.delete_namespaced_custom_object(
+            GROUP,
+            VERSION,
+            NAMESPACE,
+            PLURAL,
+            item.name,
+            body=client.V1DeleteOptions(propagation_policy="Foreground", dry_run=["All"] if dry_run else None),
+        )
+    except ApiException as e:
+        if e.status != 404:
+            raise
+        return BulkResult(item.name, "not-found", dry_run)
+    return BulkResult(item.name, "deleted", dry_run)
+
+
+def _api_error_message(e: ApiException) -> str:
+    try:
+        return json.loads(e.body)["message"]
+    except (TypeError, ValueError, KeyError):
+        return f"{e.status} {e.reason}"
+
+
+def make_api(workers: int, context: str | None = None) -> client.CustomObjectsApi:
+    if os.getenv("KUBERNETES_SERVICE_HOST"):
+        config.load_incluster_config()
+    else:
+        config.load_kube_config(context=context)
+    configuration = client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = workers
+    return client.CustomObjectsApi(client.ApiClient(configuration))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["apply", "delete"])
+    parser.add_argument("file", help="YAML or JSONL (.jsonl) file of app specs")
+    parser.add_argument("--defaults", help="YAML spec merged under the spec of every newly created app")
+    parser.add_argument("--dry-run", action="store_true", help="Validate on the API server without persisting")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--report", help="Write the per-item results to this JSONL file")
+    parser.add_argument("--context", help="kubeconfig context, when not running in the cluster")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    api = make_api(args.workers, args.context)
+    items = load_items_file(args.file)
+    if args.command == "apply":
+        defaults = yaml.safe_load(Path(args.defaults).read_text()) if args.defaults else None
+        results = apply_streamlit_apps(api, items, defaults=defaults, dry_run=args.dry_run, workers=args.workers)
+    else:
+        results = delete_streamlit_apps(api, items, dry_run=args.dry_run, workers=args.workers)
+
+    for result in results:
+        print(f"{result.name:<40} {result.action:<10} {result.error or ''}")  # noqa: T201
+    counts = {action: sum(r.action == action for r in results) for action in dict.fromkeys(r.action for r in results)}
+    print(", ".join(f"{count} {action}" for action, count in counts.items()) + (" (dry run)" if args.dry_run else ""))  # noqa: T201
+
+    if args.report:
+        with open(args.report, "w") as f:
+            for result in results:
+                f.write(json.dumps(dataclasses.asdict(result)) + "\n")
+    sys.exit(0 if all(result.ok for result in results) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,75 @@
+import dataclasses
+import datetime
+import math
 import os
 
 import streamlit as st
-from stapp_client import StappClient
+from bulk import apply_streamlit_apps, load_items
+from stapp_client import StappClient, format_age
 
 st.title("Streamlit Hub")
 
-stapp_client = StappClient()
-apps = stapp_client.list_streamlit_apps()
-
-for _idx, item in enumerate(apps):
-    if item != "hub":
-        st.divider()
-        with st.container():
-            name = item
-            st.write(f"Name: {name}")
-            st.write(
-                f"URL: https://{name}{os.environ.get('STREAMLIT_HUB_SUFFIX', '-streamlit')}.{os.environ.get('STREAMLIT_HUB_BASE_DNS_RECORD', 'example.com')}"  # noqa: E501
-            )
-            if st.button(f"Restart app {name}"):
-                stapp_client.delete_pod_for_streamlit_app(name)
-                st.write("Restarting app...")
-            if st.button(f"DANGER!!!: Delete {name}"):
-                stapp_client.delete_streamlit_app(name)
-                st.write(f"Deleted {name}")
-                st.write("Make take a minute or two to clear from UI")
+
+@st.cache_resource
+def get_stapp_client() -> StappClient:
+    return StappClient()
+
+
+stapp_client = get_stapp_client()
+
+PAGE_SIZES = [25, 50, 100]
+
+
+def app_url(name: str) -> str:
+    suffix = os.environ.get("STREAMLIT_HUB_SUFFIX", "-streamlit")
+    return f"https://{name}{suffix}.{os.environ.get('STREAMLIT_HUB_BASE_DNS_RECORD', 'example.com')}"
+
+
+# Only the current page is rendered, so the page costs the same however many apps there are
+rows = [row for row in stapp_client.app_rows() if row.name != "hub"]
+query = st.text_input("Filter", placeholder="Name, repo or ref").strip().lower()
+if query:
+    rows = [row for row in rows if any(query in field.lower() for field in (row.name, row.repo, row.ref))]
+
+size_column, page_column = st.columns(2)
+page_size = size_column.selectbox("Apps per page", PAGE_SIZES)
+pages = max(1, math.ceil(len(rows) / page_size))
+page = page_column.number_input("Page", min_value=1, max_value=pages, value=1)
+page_rows = rows[(page - 1) * page_size : page * page_size]
+st.caption(f"{len(rows)} apps, page {page} of {pages}")
+
+now = datetime.datetime.now(datetime.UTC)
+st.dataframe(
+    [
+        {
+            "Name": row.name,
+            "URL": app_url(row.name),
+            "Repo": row.repo,
+            "Ref": row.ref,
+            "Ready": f"{row.ready_replicas}/{row.replicas}",
+            "Last sync": row.revision[:12] if row.revision else "",
+            "Age": format_age(row.created, now),
+        }
+        for row in page_rows
+    ],
+    column_config={"URL": st.column_config.LinkColumn()},
+    hide_index=True,
+    use_container_width=True,
+)
+
+if page_rows:
+    name = st.selectbox("App", [row.name for row in page_rows])
+    reload_column, restart_column, delete_column = st.columns(3)
+    if reload_column.button(f"Reload code of {name}", help="Restart only the Streamlit process, in place"):
+        stapp_client.reload_streamlit_app(name)
+        st.write("Reloading code, the pods pick this up within seconds...")
+    if restart_column.button(f"Restart app {name}", help="Replace the pods one by one, without downtime"):
+        stapp_client.restart_streamlit_app(name)
+        st.write("Restarting app...")
+    if delete_column.button(f"DANGER!!!: Delete {name}"):
+        stapp_client.delete_streamlit_app(name)
+        st.write(f"Deleted {name}")
+        st.write("Make take a minute or two to clear from UI")
 
 
 with st.sidebar:
@@ -55,3 +101,15 @@ with st.sidebar:
         if st.button("Create Streamlit App"):
             # Create the custom resource
             stapp_client.create_streamlit_app(app_name, repo, ref, code_dir, additional_spec)
+
+    st.header("Bulk apply")
+    st.write(
+        "Create or update many apps at once from a YAML or JSONL file of `{name, spec}` items. "
+        "Specs are merged into existing apps. For large migrations, use `streamlit-hub/bulk.py` from a terminal."
+    )
+    bulk_file = st.file_uploader("App specs", type=["yaml", "yml", "jsonl"])
+    bulk_dry_run = st.checkbox("Dry run", value=True, help="Validate on the API server without changing anything")
+    if bulk_file is not None and st.button("Apply"):
+        items = load_items(bulk_file.getvalue().decode(), jsonl=bulk_file.name.endswith(".jsonl"))
+        results = apply_streamlit_apps(stapp_client.api, items, dry_run=bulk_dry_run)
+        st.dataframe([dataclasses.asdict(result) for result in results])
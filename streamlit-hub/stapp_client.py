@@ -1,29 +1,220 @@
+import dataclasses
+import datetime
+import json
+import logging
 import os
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable
 
 import yaml
-from kubernetes import client, config
+from kubernetes import client, config, watch
+from kubernetes.client.rest import ApiException
+
+logger = logging.getLogger(__name__)
+
+# Set on an app's pods by the operator's git poller whenever it tells them to sync a new commit
+GIT_REVISION_ANNOTATION = "fetch.com/git-revision"
+# Handled by the operator, see streamlit-operator/main.py
+RESTARTED_AT_ANNOTATION = "fetch.com/restartedAt"
+RELOADED_AT_ANNOTATION = "fetch.com/reloadedAt"
+
+
+class Informer:
+    """In-memory index of a namespaced resource, kept current by a single background watch stream.
+
+    The full list is fetched once, after which a watch is resumed from the last seen resourceVersion. The list is only
+    fetched again if the API server reports that resourceVersion as expired (410 Gone). Watch events update the index
+    in place, and the sorted snapshot readers get is only rebuilt when read after a change, so a burst of events costs
+    one sort rather than one per event.
+    """
+
+    WATCH_TIMEOUT_SECONDS = 300
+    RETRY_BACKOFF_SECONDS = 5
+
+    def __init__(self, list_fn: Callable, **list_kwargs):
+        self._list_fn = list_fn
+        self._list_kwargs = list_kwargs
+        self._lock = threading.Lock()
+        self._items: dict[str, dict] = {}
+        self._version = 0  # Bumped on every change to the index
+        self._snapshot_version = 0
+        self._snapshot: tuple[dict, ...] = ()
+        self._names: tuple[str, ...] = ()
+        self._synced = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"informer-{list_fn.__name__}", daemon=True)
+
+    def start(self) -> "Informer":
+        self._thread.start()
+        return self
+
+    def wait_for_sync(self, timeout: float | None = None) -> bool:
+        return self._synced.wait(timeout)
+
+    @property
+    def version(self) -> int:
+        """Changes whenever the index does, so anything derived from ``items()`` can be cached against it."""
+        return self._version
+
+    def items(self) -> tuple[dict, ...]:
+        """All objects currently in the index sorted by name, as an immutable snapshot rebuilt only after a change."""
+        return self._refresh()[0]
+
+    def names(self) -> tuple[str, ...]:
+        return self._refresh()[1]
+
+    def _refresh(self) -> tuple[tuple[dict, ...], tuple[str, ...]]:
+        with self._lock:
+            if self._snapshot_version != self._version:
+                self._names = tuple(sorted(self._items))
+                self._snapshot = tuple(self._items[name] for name in self._names)
+                self._snapshot_version = self._version
+            return self._snapshot, self._names
+
+    def _replace(self, items: dict[str, dict]) -> None:
+        with self._lock:
+            self._items = items
+            self._version += 1
+
+    def _apply(self, event_type: str, obj: dict) -> None:
+        with self._lock:
+            if event_type == "DELETED":
+                self._items.pop(obj["metadata"]["name"], None)
+            else:
+                self._items[obj["metadata"]["name"]] = obj
+            self._version += 1
+
+    def _relist(self) -> str:
+        # Call with _preload_content=False so core resources (pods) are indexed as plain dicts, like custom objects
+        response = self._list_fn(**self._list_kwargs, _preload_content=False)
+        resource_list = json.loads(response.data)
+        self._replace({item["metadata"]["name"]: item for item in resource_list["items"]})
+        self._synced.set()
+        return resource_list["metadata"]["resourceVersion"]
+
+    def _run(self) -> None:
+        resource_version = None
+        while True:
+            try:
+                if resource_version is None:
+                    resource_version = self._relist()
+
+                w = watch.Watch()
+                for event in w.stream(
+                    self._list_fn,
+                    resource_version=resource_version,
+                    timeout_seconds=self.WATCH_TIMEOUT_SECONDS,
+                    **self._list_kwargs,
+                ):
+                    obj = event["raw_object"]
+                    self._apply(event["type"], obj)
+                    resource_version = obj["metadata"]["resourceVersion"]
+            except ApiException as e:
+                if e.status == 410:
+                    logger.info("Watch for %s expired, relisting", self._list_fn.__name__)
+                    resource_version = None
+                    continue
+                logger.exception("Watch for %s failed, retrying", self._list_fn.__name__)
+                time.sleep(self.RETRY_BACKOFF_SECONDS)
+            except Exception:
+                logger.exception("Watch for %s failed, retrying", self._list_fn.__name__)
+                time.sleep(self.RETRY_BACKOFF_SECONDS)
+
+
+@dataclasses.dataclass(frozen=True)
+class AppRow:
+    name: str
+    repo: str
+    ref: str
+    ready_replicas: int
+    replicas: int
+    revision: str | None  # None until the first sync after the pods cloned the ref on startup
+    created: datetime.datetime
+
+
+def build_app_rows(apps: tuple[dict, ...], pods: tuple[dict, ...]) -> list[AppRow]:
+    pods_by_app = defaultdict(list)
+    for pod in pods:
+        pods_by_app[pod["metadata"].get("labels", {}).get("app")].append(pod)
+
+    rows = []
+    for app in apps:
+        name = app["metadata"]["name"]
+        app_pods = pods_by_app.get(name, [])
+        revisions = [pod["metadata"].get("annotations", {}).get(GIT_REVISION_ANNOTATION) for pod in app_pods]
+        rows.append(
+            AppRow(
+                name=name,
+                repo=app.get("spec", {}).get("repo", ""),
+                ref=app.get("spec", {}).get("ref", ""),
+                ready_replicas=sum(is_pod_ready(pod) for pod in app_pods),
+                replicas=len(app_pods),
+                # Pods annotate the revision they serve, the operator's status has the latest one it has seen
+                revision=next((revision for revision in revisions if revision), None)
+                or (app.get("status") or {}).get("commit"),
+                created=datetime.datetime.fromisoformat(app["metadata"]["creationTimestamp"]),
+            )
+        )
+    return rows
+
+
+def is_pod_ready(pod: dict) -> bool:
+    conditions = pod.get("status", {}).get("conditions") or []
+    return any(c["type"] == "Ready" and c["status"] == "True" for c in conditions)
+
+
+def format_age(created: datetime.datetime, now: datetime.datetime) -> str:
+    """Age in the largest whole unit, like kubectl get."""
+    seconds = max(0, int((now - created).total_seconds()))
+    for unit, unit_seconds in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= unit_seconds:
+            return f"{seconds // unit_seconds}{unit}"
+    return f"{seconds}s"
 
 
 class StappClient:
-    def __init__(self):
-        if os.getenv("ENVIRONMENT") == "local":
+    def __init__(self, api_client: client.ApiClient | None = None):
+        # An explicit API client (e.g. one for experiments/fake_kube_api.py) is used as is, without any kube config
+        if api_client is not None:
+            self.config = None
+        elif os.getenv("ENVIRONMENT") == "local":
             self.config = config.load_kube_config(config_file="~/.kube/config", context="proxy")
         else:
             self.config = config.load_incluster_config()
-        self.api = client.CustomObjectsApi()
-        self.v1 = client.CoreV1Api()
+        self.api = client.CustomObjectsApi(api_client)
+        self.v1 = client.CoreV1Api(api_client)
+
+        # Created once per hub process (see main.py), so every viewer and rerun shares these two watch streams
+        self.apps_informer = Informer(
+            self.api.list_namespaced_custom_object,
+            group="fetch.com",
+            version="v1",
+            namespace="streamlit",
+            plural="streamlit-apps",
+        ).start()
+        self.pods_informer = Informer(self.v1.list_namespaced_pod, namespace="streamlit").start()
+        self.apps_informer.wait_for_sync(timeout=30)
+
+        self._rows_lock = threading.Lock()
+        self._rows_versions: tuple[int, int] | None = None
+        self._rows: list[AppRow] = []
 
     def list_streamlit_apps(self):
-        # List instances of the custom resource
-        custom_resource_list = self.api.list_namespaced_custom_object(
-            group="fetch.com", version="v1", namespace="streamlit", plural="streamlit-apps"
-        )
+        return list(self.apps_informer.names())
+
+    def app_rows(self) -> list[AppRow]:
+        """One row per app, shared by every viewer and rebuilt only when the apps or pods have changed."""
+        with self._rows_lock:
+            # Read the versions first: a change after that only makes the next call rebuild the rows again
+            versions = (self.apps_informer.version, self.pods_informer.version)
+            if versions != self._rows_versions:
+                self._rows = build_app_rows(self.apps_informer.items(), self.pods_informer.items())
+                self._rows_versions = versions
+            return self._rows
 
-        outputs = []
-        for item in custom_resource_list["items"]:
-            name = item["metadata"]["name"]
-            outputs.append(name)
-        return outputs
+    def list_pods_for_streamlit_app(self, name):
+        return [pod for pod in self.pods_informer.items() if pod["metadata"].get("labels", {}).get("app") == name]
 
     def create_streamlit_app(self, name, repo, ref, code_dir, additional_spec: str = "{}"):
         spec = {
@@ -52,17 +243,23 @@ class StappClient:
             body=client.V1DeleteOptions(propagation_policy="Foreground"),
         )
 
-    def delete_pod_for_streamlit_app(self, name):
-        # Find the pod for the custom resource
-        pod_list = self.v1.list_namespaced_pod(namespace="streamlit", label_selector=f"app={name}")
-        # Delete the pod
-        for item in pod_list.items:
-            pod_name = item.metadata.name
-            self.v1.delete_namespaced_pod(
-                name=pod_name,
-                namespace="streamlit",
-                body=client.V1DeleteOptions(propagation_policy="Foreground"),
-            )
+    def restart_streamlit_app(self, name) -> dict:
+        """Have the operator roll the app's pods, a new pod becoming ready before an old one goes away."""
+        return self._annotate_streamlit_app(name, RESTARTED_AT_ANNOTATION)
+
+    def reload_streamlit_app(self, name) -> dict:
+        """Have the operator restart just the Streamlit process in each of the app's pods, to pick up code changes."""
+        return self._annotate_streamlit_app(name, RELOADED_AT_ANNOTATION)
+
+    def _annotate_streamlit_app(self, name, annotation) -> dict:
+        return self.api.patch_namespaced_custom_object(
+            group="fetch.com",
+            version="v1",
+            namespace="streamlit",
+            plural="streamlit-apps",
+            name=name,
+            body={"metadata": {"annotations": {annotation: datetime.datetime.now(datetime.UTC).isoformat()}}},
+        )
 
 
 def deep_update(mapping, *updating_mappings):
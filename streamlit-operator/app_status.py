@@ -0,0 +1,158 @@
+"""The status of StreamlitApps: conditions, observed generation, replicas and commit, written in coalesced patches.
+
+Conditions follow the Kubernetes conventions (type, status, reason, message, lastTransitionTime), with three types:
+
+- Synced: the children of the app's current spec were applied (observedGeneration says which spec that was).
+- Ready: the app's Deployment has a ready pod.
+- Degraded: the Deployment is failing to roll out (progress deadline exceeded or pods failing to be created).
+"""
+
+import datetime
+from collections.abc import Awaitable, Callable
+
+from drift import WorkQueue, run_workers
+from kubernetes.client.rest import ApiException
+from metrics import STATUS_PATCHES, STATUS_QUEUE_DEPTH, STATUS_UPDATES
+
+CONDITION_TYPES = ("Synced", "Ready", "Degraded")
+# Status fields maintained here, other fields of the status belong to kopf handlers, idle scaling etc.
+STATUS_FIELDS = (
+    "observedGeneration",
+    "dnsName",
+    "commit",
+    "replicas",
+    "readyReplicas",
+    "updatedReplicas",
+    "conditions",
+)
+
+# condition type -> (status, reason, message)
+Conditions = dict[str, tuple[str, str, str]]
+
+
+def deployment_status(deployment: dict) -> tuple[dict, Conditions]:
+    """Status fields and Ready/Degraded conditions of an app, from (a watch event body of) its Deployment."""
+    desired = deployment.get("spec", {}).get("replicas", 1)
+    status = deployment.get("status") or {}
+    ready = status.get("readyReplicas") or 0
+    deployment_conditions = {cond["type"]: cond for cond in status.get("conditions") or []}
+
+    if ready:
+        ready_condition = ("True", "ReplicasReady", f"{ready}/{desired} replicas are ready")
+    elif desired == 0:
+        ready_condition = ("False", "ScaledToZero", "The app is scaled to zero")
+    else:
+        ready_condition = ("False", "NoReadyReplicas", f"0/{desired} replicas are ready")
+
+    progressing = deployment_conditions.get("Progressing", {})
+    replica_failure = deployment_conditions.get("ReplicaFailure", {})
+    if progressing.get("status") == "False":
+        degraded_condition = ("True", progressing.get("reason", "NotProgressing"), progressing.get("message", ""))
+    elif replica_failure.get("status") == "True":
+        degraded_condition = ("True", "ReplicaFailure", replica_failure.get("message", ""))
+    else:
+        degraded_condition = ("False", "AsExpected", "")
+
+    fields = {"replicas": desired, "readyReplicas": ready, "updatedReplicas": status.get("updatedReplicas") or 0}
+    return fields, {"Ready": ready_condition, "Degraded": degraded_condition}
+
+
+def merge_conditions(current: list[dict], conditions: Conditions, now: str) -> list[dict]:
+    """``current`` with ``conditions`` set, keeping each condition's lastTransitionTime unless its status changed."""
+    merged = {cond["type"]: cond for cond in current}
+    for type_, (status, reason, message) in conditions.items():
+        previous = merged.get(type_, {})
+        merged[type_] = {
+            "type": type_,
+            "status": status,
+            "reason": reason,
+            "message": message,
+            "lastTransitionTime": previous["lastTransitionTime"] if previous.get("status") == status else now,
+        }
+    ordered = [
+        *(type_ for type_ in CONDITION_TYPES if type_ in merged),
+        *(t for t in merged if t not in CONDITION_TYPES),
+    ]
+    return [merged[type_] for type_ in ordered]
+
+
+class AppStatusWriter:
+    """Collects status updates of StreamlitApps and writes each app's in at most one patch per ``debounce_seconds``.
+
+    Updates only change the wanted status of an app in memory, and a flush patches just the fields that differ from
+    the app's live status (as last seen by the operator's index of the apps, or last written by this writer). So a
+    burst of Deployment events during a rollout turns into a single patch, and events that don't change anything (a
+    resync, an operator restart) don't write at all. kopf handlers ``take`` the pending update instead, which folds it
+    into the status patch kopf writes at the end of the handler anyway.
+    """
+
+    def __init__(
+        self,
+        patch: Callable[[str, dict], Awaitable[None]],
+        live_status: Callable[[str], dict],
+        debounce_seconds: float,
+    ):
+        self._patch = patch
+        self._live_status = live_status
+        self._debounce_seconds = debounce_seconds
+        self._wanted: dict[str, tuple[dict, Conditions]] = {}
+        self._written: dict[str, dict] = {}
+        self._queue = WorkQueue(debounce_seconds, 60 * debounce_seconds, depth_gauge=STATUS_QUEUE_DEPTH)
+
+    def update(self, name: str, fields: dict | None = None, conditions: Conditions | None = None) -> None:
+        """Have ``fields`` and ``conditions`` written into the status of ``name`` with the next flush."""
+        STATUS_UPDATES.inc()
+        wanted_fields, wanted_conditions = self._wanted.setdefault(name, ({}, {}))
+        wanted_fields.update(fields or {})
+        wanted_conditions.update(conditions or {})
+        self._queue.add(name, delay=self._debounce_seconds)
+
+    def take(self, name: str, fields: dict | None = None, conditions: Conditions | None = None) -> dict:
+        """The status patch for ``name`` with all its pending updates and these, to be written by the caller."""
+        STATUS_UPDATES.inc()
+        wanted_fields, wanted_conditions = self._wanted.pop(name, ({}, {}))
+        return self._diff(name, {**wanted_fields, **(fields or {})}, {**wanted_conditions, **(conditions or {})})
+
+    def forget(self, name: str) -> None:
+        self._wanted.pop(name, None)
+        self._written.pop(name, None)
+
+    async def run(self, workers: int) -> None:
+        await run_workers(self._queue, self._flush, workers)
+
+    async def _flush(self, name: str) -> None:
+        if name not in self._wanted:
+            return  # Taken by a handler in the meantime
+        fields, conditions = self._wanted.pop(name)
+        status_patch = self._diff(name, fields, conditions)
+        if not status_patch:
+            return
+        try:
+            await self._patch(name, status_patch)
+        except ApiException as e:
+            if e.status == 404:
+                self.forget(name)  # Deleted
+                return
+            # Retried with backoff: compare against the live status again, and keep any updates made in the meantime
+            for key in status_patch:
+                self._written[name].pop(key, None)
+            newer_fields, newer_conditions = self._wanted.get(name, ({}, {}))
+            self._wanted[name] = ({**fields, **newer_fields}, {**conditions, **newer_conditions})
+            raise
+        STATUS_PATCHES.inc()
+
+    def _diff(self, name: str, fields: dict, conditions: Conditions) -> dict:
+        live = self._live_status(name)
+        # What this writer wrote that the index has not seen yet
+        written = {key: value for key, value in self._written.get(name, {}).items() if live.get(key) != value}
+        current = {**live, **written}
+
+        status_patch = {key: value for key, value in fields.items() if current.get(key) != value}
+        if conditions:
+            merged = merge_conditions(
+                current.get("conditions") or [], conditions, datetime.datetime.now(datetime.UTC).isoformat()
+            )
+            if merged != current.get("conditions"):
+                status_patch["conditions"] = merged
+        self._written[name] = {**written, **status_patch}
+        return status_patch
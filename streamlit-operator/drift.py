@@ -0,0 +1,166 @@
+import asyncio
+import contextlib
+import heapq
+import logging
+from collections.abc import Awaitable, Callable, Hashable
+
+from kubernetes.utils import parse_quantity
+from metrics import DRIFT_QUEUE_DEPTH
+from prometheus_client import Gauge
+
+# Values the API server omits from the objects it returns, so their absence from a live object is not drift
+EMPTY_VALUES = (None, "", [], {})
+# Maps of resource name to quantity, in container resources
+QUANTITY_FIELDS = frozenset({"limits", "requests"})
+
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second on average, and bursts of up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated: float | None = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._updated is not None:
+                    self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class WorkQueue:
+    """Deduplicating work queue with per-key exponential backoff, in the spirit of client-go's rate-limited workqueue.
+
+    A key is queued at most once however often it is added, and a key added while it is being processed is processed
+    again once ``done``, never concurrently. ``retry`` re-adds a key after a delay that doubles with each consecutive
+    failure, up to ``max_delay``, until ``forget`` resets it.
+    """
+
+    def __init__(self, base_delay: float, max_delay: float, *, depth_gauge: Gauge = DRIFT_QUEUE_DEPTH):
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._heap: list[tuple[float, int, Hashable]] = []  # (ready at, tie breaker, key)
+        self._counter = 0
+        self._ready_at: dict[Hashable, float] = {}
+        self._processing: set[Hashable] = set()
+        self._dirty: set[Hashable] = set()
+        self._failures: dict[Hashable, int] = {}
+        self._changed = asyncio.Event()
+        self._depth_gauge = depth_gauge
+
+    def __len__(self) -> int:
+        return len(self._ready_at)
+
+    def add(self, key: Hashable, delay: float = 0) -> None:
+        if key in self._processing:
+            self._dirty.add(key)
+            return
+        ready_at = asyncio.get_running_loop().time() + delay
+        if key in self._ready_at and self._ready_at[key] <= ready_at:
+            return  # Already queued, at least as soon
+        self._ready_at[key] = ready_at
+        self._counter += 1
+        heapq.heappush(self._heap, (ready_at, self._counter, key))
+        self._depth_gauge.set(len(self))
+        self._changed.set()
+
+    def retry(self, key: Hashable) -> None:
+        failures = self._failures.get(key, 0)
+        self._failures[key] = failures + 1
+        self.add(key, min(self._base_delay * 2**failures, self._max_delay))
+
+    def forget(self, key: Hashable) -> None:
+        self._failures.pop(key, None)
+
+    async def get(self) -> Hashable:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Drop heap entries superseded by an earlier re-add of the same key
+            while self._heap and self._ready_at.get(self._heap[0][2]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            timeout = None
+            if self._heap:
+                ready_at, _, key = self._heap[0]
+                if ready_at <= loop.time():
+                    heapq.heappop(self._heap)
+                    del self._ready_at[key]
+                    self._processing.add(key)
+                    self._depth_gauge.set(len(self))
+                    return key
+                timeout = ready_at - loop.time()
+
+            self._changed.clear()
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(self._changed.wait(), timeout)
+
+    def done(self, key: Hashable) -> None:
+        self._processing.discard(key)
+        if key in self._dirty:
+            self._dirty.discard(key)
+            self.add(key)
+
+
+async def run_workers(
+    queue: WorkQueue,
+    process: Callable[[Hashable], Awaitable[None]],
+    workers: int,
+) -> None:
+    """Process keys from ``queue`` with ``workers`` concurrent workers, retrying failed keys with backoff."""
+
+    async def worker() -> None:
+        while True:
+            key = await queue.get()
+            try:
+                await process(key)
+            except Exception:
+                logging.exception("Error processing %s, will retry", key)
+                failed = True
+            else:
+                failed = False
+            # Mark the key done before retrying it, a retry of a key still being processed would not be delayed
+            queue.done(key)
+            if failed:
+                queue.retry(key)
+            else:
+                queue.forget(key)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+
+def is_subset(desired, live, *, quantities: bool = False) -> bool:
+    """Whether every field set in ``desired`` has the same value in ``live``.
+
+    Fields only present in ``live`` (server-side defaults, status, fields set by other controllers such as an HPA's
+    replicas) are not drift, and neither are empty maps, lists and strings in ``desired`` that ``live`` lacks, since the
+    API server drops those. Resource quantities are compared by value, as the server stores them in canonical form
+    (``0.5`` CPU comes back as ``500m``).
+    """
+    if live is None and desired in EMPTY_VALUES:
+        return True
+    if isinstance(desired, dict):
+        live = {} if live is None else live
+        return isinstance(live, dict) and all(
+            is_subset(v, live.get(k), quantities=quantities or k in QUANTITY_FIELDS) for k, v in desired.items()
+        )
+    if isinstance(desired, list):
+        return (
+            isinstance(live, list)
+            and len(desired) == len(live)
+            and all(is_subset(d, lv) for d, lv in zip(desired, live, strict=True))
+        )
+    if quantities and desired != live and live is not None:
+        try:
+            return parse_quantity(desired) == parse_quantity(live)
+        except ValueError:
+            return False
+    return desired == live
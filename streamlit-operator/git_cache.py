@@ -0,0 +1,95 @@
+"""Node-local mirrors of the repositories of all StreamlitApps, kept up to date by the git cache DaemonSet.
+
+App pods on the node mount the mirrors read-only and point their git-sync at them as alternate object directories, so
+a new pod only downloads the objects its node has not mirrored yet, rather than everything its checkout needs.
+
+    python git_cache.py --root /var/cache/streamlit-git --interval-seconds 300
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import time
+from pathlib import Path
+
+from git_poller import authenticated_url, git_ssh_env, normalize_repo_url
+from kubernetes import client, config
+
+
+def mirror_dir_name(repo: str) -> str:
+    """Directory of the repo's mirror under the cache root, the same for every spelling of the repo's URL."""
+    return hashlib.sha256(normalize_repo_url(repo).encode()).hexdigest()[:16]
+
+
+def update_mirror(root: Path, repo: str) -> None:
+    path = root / mirror_dir_name(repo)
+    if not path.exists():
+        # Clone next to the final path and move it in place, so pods never use a half-initialised mirror
+        staging = root / f".{path.name}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        _git("init", "--quiet", "--bare", str(staging))
+        # Pods' repositories may still need objects a force push made unreachable, so never prune them
+        _git("-C", str(staging), "config", "gc.pruneExpire", "never")
+        _fetch(staging, repo)
+        staging.rename(path)
+        logging.info("Mirrored %s into %s", repo, path)
+    else:
+        _fetch(path, repo)
+
+
+def _fetch(path: Path, repo: str) -> None:
+    # Fetch from the URL rather than a configured remote, so the credentials never end up in the mirror's config
+    _git(
+        "-C",
+        str(path),
+        "fetch",
+        "--quiet",
+        "--prune",
+        authenticated_url(repo),
+        "+refs/heads/*:refs/heads/*",
+        "+refs/tags/*:refs/tags/*",
+    )
+
+
+def _git(*args: str) -> None:
+    subprocess.run(
+        ["git", *args],
+        check=True,
+        capture_output=True,
+        env={**os.environ, **git_ssh_env(), "GIT_TERMINAL_PROMPT": "0"},
+    )
+
+
+def list_repos(api: client.CustomObjectsApi) -> dict[str, str]:
+    apps = api.list_namespaced_custom_object("fetch.com", "v1", "streamlit", "streamlit-apps")
+    return {mirror_dir_name(app["spec"]["repo"]): app["spec"]["repo"] for app in apps["items"]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", type=Path, required=True)
+    parser.add_argument("--interval-seconds", type=int, default=300)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    config.load_incluster_config()
+    api = client.CustomObjectsApi()
+    while True:
+        try:
+            repos = list_repos(api)
+        except client.ApiException:
+            logging.exception("Error listing StreamlitApps")
+            repos = {}
+        for repo in repos.values():
+            try:
+                update_mirror(args.root, repo)
+            except subprocess.CalledProcessError as e:
+                logging.error("Error mirroring %s: %s", repo, e.stderr.decode().strip())  # noqa: TRY400
+        time.sleep(args.interval_seconds)
+
+
+if __name__ == "__main__":
+    main()
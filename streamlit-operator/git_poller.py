@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import urllib.parse
+from collections.abc import Awaitable, Callable, Iterable, Mapping
+
+from aiohttp import web
+
+GitRef = tuple[str, str]  # (repo, ref)
+
+COMMIT_SHA_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+# git ls-remote subprocesses running at once, however many refs a poll or a webhook refreshes
+MAX_CONCURRENT_LS_REMOTES = 8
+
+
+class GitRefPoller:
+    """Resolves every distinct (repo, ref) tracked by StreamlitApps once per interval.
+
+    However many apps and replicas track the same ref, it costs one ``git ls-remote`` per interval. When a ref moves,
+    ``on_change`` is called once with the new commit and the names of the apps tracking the ref, so that only their pods
+    are told to sync.
+    """
+
+    def __init__(
+        self,
+        tracked: Mapping[GitRef, Iterable[str]],
+        interval_seconds: int,
+        on_change: Callable[[GitRef, str, list[str]], Awaitable[None]],
+        max_concurrent_ls_remotes: int = MAX_CONCURRENT_LS_REMOTES,
+    ):
+        self._tracked = tracked
+        self._interval_seconds = interval_seconds
+        self._on_change = on_change
+        self._revisions: dict[GitRef, str] = {}
+        self._refreshing: dict[GitRef, asyncio.Task] = {}
+        self._ls_remote_slots = asyncio.Semaphore(max_concurrent_ls_remotes)
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.gather(*(self.refresh(git_ref) for git_ref in list(self._tracked)))
+            await asyncio.sleep(self._interval_seconds)
+
+    def revision(self, git_ref: GitRef) -> str | None:
+        """The commit ``git_ref`` last resolved to, if it was resolved yet."""
+        return self._revisions.get(git_ref)
+
+    def refresh(self, git_ref: GitRef) -> asyncio.Task:
+        # Collapse concurrent refreshes of the same ref (e.g. a webhook arriving during a poll) into one ls-remote
+        task = self._refreshing.get(git_ref)
+        if task is None or task.done():
+            task = self._refreshing[git_ref] = asyncio.create_task(self._refresh(git_ref))
+        return task
+
+    def refresh_repos(self, repo_urls: Iterable[str]) -> int:
+        repos = {normalize_repo_url(url) for url in repo_urls}
+        git_refs = [git_ref for git_ref in list(self._tracked) if normalize_repo_url(git_ref[0]) in repos]
+        for git_ref in git_refs:
+            self.refresh(git_ref)
+        return len(git_refs)
+
+    async def _refresh(self, git_ref: GitRef) -> None:
+        repo, ref = git_ref
+        if COMMIT_SHA_PATTERN.match(ref):
+            return  # Pinned to a commit, can never move
+
+        try:
+            async with self._ls_remote_slots:
+                revision = await ls_remote(repo, ref)
+        except Exception:
+            logging.exception("Error resolving %s@%s", repo, ref)
+            return
+
+        previous = self._revisions.get(git_ref)
+        self._revisions[git_ref] = revision
+        # The first resolution only records the revision, pods started recently enough to have cloned it already
+        if previous is not None and revision != previous:
+            logging.info("%s@%s moved from %s to %s", repo, ref, previous, revision)
+            await self._on_change(git_ref, revision, list(self._tracked.get(git_ref, ())))
+
+
+async def ls_remote(repo: str, ref: str) -> str:
+    process = await asyncio.create_subprocess_exec(
+        "git",
+        "ls-remote",
+        authenticated_url(repo),
+        ref,
+        f"{ref}^{{}}",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env={**os.environ, **git_ssh_env(), "GIT_TERMINAL_PROMPT": "0"},
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise RuntimeError(f"git ls-remote failed: {stderr.decode().strip()}")
+    # ls-remote matches the ref as a suffix pattern, so pick the exact branch or tag (peeled for annotated tags)
+    revisions = dict(reversed(line.split("\t", 1)) for line in stdout.decode().splitlines() if line)
+    for candidate in (ref, f"refs/heads/{ref}", f"refs/tags/{ref}^{{}}", f"refs/tags/{ref}"):
+        if candidate in revisions:
+            return revisions[candidate]
+    raise RuntimeError(f"Ref {ref} not found in {repo}")
+
+
+def authenticated_url(repo: str) -> str:
+    # Use the same credentials as the git-sync sidecars, when they are mounted into the operator
+    username = os.environ.get("GITSYNC_USERNAME")
+    password = os.environ.get("GITSYNC_PASSWORD")
+    url = urllib.parse.urlsplit(repo)
+    if not (username and password and url.scheme == "https"):
+        return repo
+    credentials = f"{urllib.parse.quote(username, safe='')}:{urllib.parse.quote(password, safe='')}"
+    return urllib.parse.urlunsplit(url._replace(netloc=f"{credentials}@{url.netloc}"))
+
+
+def git_ssh_env() -> dict[str, str]:
+    # Same defaults as git-sync
+    key_file = os.environ.get("GITSYNC_SSH_KEY_FILE", "/etc/git-secret/ssh")
+    known_hosts_file = os.environ.get("GITSYNC_SSH_KNOWN_HOSTS_FILE", "/etc/git-secret/known_hosts")
+    if not os.path.exists(key_file):
+        return {}
+    return {"GIT_SSH_COMMAND": f"ssh -i {key_file} -o IdentitiesOnly=yes -o UserKnownHostsFile={known_hosts_file}"}
+
+
+def normalize_repo_url(url: str) -> str:
+    return url.lower().rstrip("/").removesuffix(".git")
+
+
+def make_webhook_handler(poller: GitRefPoller, secret: str) -> Callable[[web.Request], Awaitable[web.Response]]:
+    """Handle GitHub/GitLab push webhooks by refreshing every tracked ref of the pushed repository right away.
+
+    Every webhook must be signed with (GitHub) or carry (GitLab) ``secret``, which must not be empty.
+    """
+    if not secret:
+        raise ValueError("The git webhook needs a secret")
+
+    async def handle(request: web.Request) -> web.Response:
+        payload = await request.read()
+        if not (
+            _valid_github_signature(secret, payload, request.headers.get("X-Hub-Signature-256", ""))
+            or hmac.compare_digest(secret, request.headers.get("X-Gitlab-Token", ""))
+        ):
+            return web.Response(status=401, text="Invalid webhook signature")
+
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict):
+            return web.Response(status=400, text="Expected a JSON object")
+        repo_urls = [
+            url
+            for key in ("repository", "project")
+            for field in ("clone_url", "ssh_url", "html_url", "git_http_url", "git_ssh_url")
+            if (url := (event.get(key) or {}).get(field))
+        ]
+        refreshed = poller.refresh_repos(repo_urls)
+        return web.json_response({"refreshed": refreshed}, status=202)
+
+    return handle
+
+
+def _valid_github_signature(secret: str, payload: bytes, signature: str) -> bool:
+    expected = "sha256=" + hmac.new(secret.encode(), payload, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
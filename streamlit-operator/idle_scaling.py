@@ -0,0 +1,92 @@
+import asyncio
+import html
+import logging
+from collections.abc import Awaitable, Callable, Iterable
+
+import aiohttp
+from aiohttp import web
+
+WAKING_PAGE = """<!DOCTYPE html>
+<html>
+  <head>
+    <meta http-equiv="refresh" content="5">
+    <title>Waking up {name}</title>
+  </head>
+  <body style="font-family: sans-serif; text-align: center; margin-top: 20vh">
+    <h1>Waking up {name}&hellip;</h1>
+    <p>This app was scaled down after being idle. This page will reload once it is ready.</p>
+  </body>
+</html>
+"""
+
+
+async def fetch_idle_seconds(pod_ips: list[str], port: int) -> float | None:
+    """Seconds since any of the pods last had a client connection, or None if any pod could not be asked."""
+    timeout = aiohttp.ClientTimeout(total=5)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+
+        async def fetch(pod_ip: str) -> float:
+            async with session.get(f"http://{pod_ip}:{port}/activity") as response:
+                response.raise_for_status()
+                return (await response.json())["idleSeconds"]
+
+        try:
+            idle_seconds = await asyncio.gather(*(fetch(pod_ip) for pod_ip in pod_ips))
+        except (aiohttp.ClientError, TimeoutError):
+            logging.warning("Could not fetch activity from pods %s", pod_ips, exc_info=True)
+            return None
+    return min(idle_seconds)
+
+
+async def post_to_pods(pod_ips: list[str], port: int, path: str, data: str, token: str) -> int:
+    """POST ``data`` to ``path`` of the connection tracker of each pod (a reload or revision request, see launch.sh),
+    authenticated with the app's ``token``. Returns how many pods took it.
+    """
+    timeout = aiohttp.ClientTimeout(total=5)
+    headers = {"Authorization": f"Bearer {token}"}
+    async with aiohttp.ClientSession(timeout=timeout, headers=headers) as session:
+
+        async def send(pod_ip: str) -> None:
+            async with session.post(f"http://{pod_ip}:{port}{path}", data=data) as response:
+                response.raise_for_status()
+
+        results = await asyncio.gather(*(send(pod_ip) for pod_ip in pod_ips), return_exceptions=True)
+    for pod_ip, result in zip(pod_ips, results, strict=True):
+        if isinstance(result, Exception):
+            logging.warning("Could not POST %s to pod %s: %s", path, pod_ip, result)
+    return sum(not isinstance(result, Exception) for result in results)
+
+
+def make_activator_app(
+    resolve_app_name: Callable[[str], str | None],
+    wake: Callable[[str], Awaitable[None]],
+    routes: Iterable[web.RouteDef] = (),
+) -> web.Application:
+    """HTTP app serving the Ingress of every sleeping StreamlitApp.
+
+    Each request starts waking the app it was addressed to (at most one wake per app at a time) and gets a holding page
+    that reloads itself until the app's Ingress is pointed back at the app. ``routes`` (e.g. the operator's own
+    endpoints) take precedence over the catch-all activator route.
+    """
+    waking: dict[str, asyncio.Task] = {}
+
+    async def handle(request: web.Request) -> web.Response:
+        name = resolve_app_name(request.host.split(":")[0])
+        if name is None:
+            return web.Response(status=404, text="Unknown app")
+
+        task = waking.get(name)
+        if task is None or task.done():
+            waking[name] = asyncio.create_task(wake(name), name=f"wake-{name}")
+
+        return web.Response(
+            status=503,
+            text=WAKING_PAGE.format(name=html.escape(name)),
+            content_type="text/html",
+            headers={"Retry-After": "5"},
+        )
+
+    app = web.Application()
+    app.add_routes(routes)
+    app.router.add_route("*", "/{tail:.*}", handle)
+    return app
@@ -0,0 +1,111 @@
+import asyncio
+import contextlib
+import functools
+import json
+import time
+from collections.abc import AsyncIterator, Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, TypeVar
+
+import kubernetes
+from metrics import API_CALL_DURATION, API_CALL_ERRORS, RECONCILES_ACTIVE, RECONCILES_WAITING
+
+T = TypeVar("T")
+
+# Each reconcile writes up to four children (Deployment, Service, Ingress, HorizontalPodAutoscaler) at the same time
+CHILDREN_PER_APP = 4
+
+# Field manager name recorded on everything the operator server-side applies
+FIELD_MANAGER = "streamlit-operator"
+
+RESOURCE_PATHS = {
+    ("apps/v1", "Deployment"): "/apis/apps/v1/namespaces/{namespace}/deployments/{name}",
+    ("v1", "Service"): "/api/v1/namespaces/{namespace}/services/{name}",
+    ("networking.k8s.io/v1", "Ingress"): "/apis/networking.k8s.io/v1/namespaces/{namespace}/ingresses/{name}",
+    ("autoscaling/v2", "HorizontalPodAutoscaler"): (
+        "/apis/autoscaling/v2/namespaces/{namespace}/horizontalpodautoscalers/{name}"
+    ),
+}
+
+
+class KubeClients:
+    """Process-wide Kubernetes API clients, shared by all handlers.
+
+    The clients share one pooled ``ApiClient`` (and therefore one urllib3 connection pool). Blocking calls are
+    dispatched onto a dedicated thread pool so that async handlers can issue them concurrently, and the number of apps
+    being reconciled at any one time is capped by ``max_concurrent_reconciles``.
+    """
+
+    def __init__(self, max_concurrent_reconciles: int):
+        configuration = kubernetes.client.Configuration.get_default_copy()  # type: ignore
+        configuration.connection_pool_maxsize = max_concurrent_reconciles * CHILDREN_PER_APP
+
+        self.api_client = kubernetes.client.ApiClient(configuration)  # type: ignore
+        self.core = kubernetes.client.CoreV1Api(self.api_client)  # type: ignore
+        self.apps = kubernetes.client.AppsV1Api(self.api_client)  # type: ignore
+        self.networking = kubernetes.client.NetworkingV1Api(self.api_client)  # type: ignore
+        self.autoscaling = kubernetes.client.AutoscalingV2Api(self.api_client)  # type: ignore
+        self.coordination = kubernetes.client.CoordinationV1Api(self.api_client)  # type: ignore
+        self.custom = kubernetes.client.CustomObjectsApi(self.api_client)  # type: ignore
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent_reconciles * CHILDREN_PER_APP,
+            thread_name_prefix="kube-api",
+        )
+        self._reconcile_slots = asyncio.Semaphore(max_concurrent_reconciles)
+
+    async def call(self, fn: Callable[..., T], /, *args: Any, **kwargs: Any) -> T:
+        """Run a blocking Kubernetes client call on the shared thread pool."""
+        operation = fn.__name__
+        if operation == "apply":
+            operation = f"apply_{args[0]['kind'].lower()}"
+
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+        except Exception:
+            API_CALL_ERRORS.labels(operation).inc()
+            raise
+        finally:
+            API_CALL_DURATION.labels(operation).observe(time.perf_counter() - start)
+
+    def apply(self, manifest: dict, namespace: str) -> dict:
+        """Server-side apply ``manifest``, creating the object if it does not exist yet.
+
+        The typed client of the pinned kubernetes version cannot send ``application/apply-patch+yaml``, so this goes
+        through ``ApiClient.call_api`` directly. Fields previously applied by the operator but missing from ``manifest``
+        are removed, and applying an unchanged manifest is a no-op on the server (no new resourceVersion).
+        """
+        path = RESOURCE_PATHS[manifest["apiVersion"], manifest["kind"]]
+        return self.api_client.call_api(  # type: ignore
+            path,
+            "PATCH",
+            path_params={"namespace": namespace, "name": manifest["metadata"]["name"]},
+            query_params=[("fieldManager", FIELD_MANAGER), ("force", "true")],
+            header_params={"Content-Type": "application/apply-patch+yaml", "Accept": "application/json"},
+            body=json.dumps(manifest),  # JSON is valid YAML
+            response_type="object",
+            auth_settings=["BearerToken"],
+            _return_http_data_only=True,
+        )
+
+    @contextlib.asynccontextmanager
+    async def reconcile_slot(self) -> AsyncIterator[None]:
+        """Hold one of the ``max_concurrent_reconciles`` slots for the duration of a reconcile."""
+        RECONCILES_WAITING.inc()
+        try:
+            await self._reconcile_slots.acquire()
+        finally:
+            RECONCILES_WAITING.dec()
+
+        RECONCILES_ACTIVE.inc()
+        try:
+            yield
+        finally:
+            RECONCILES_ACTIVE.dec()
+            self._reconcile_slots.release()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self.api_client.close()
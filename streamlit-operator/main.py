@@ -1,27 +1,124 @@
+import asyncio
+import contextlib
+import datetime
+import functools
+import json
 import logging
+import os
+import socket
+from collections.abc import AsyncIterator
 
 import kopf
 import kubernetes
+import prometheus_client
 import pydantic
 import yaml
+from aiohttp import web
+from app_status import STATUS_FIELDS, AppStatusWriter, deployment_status
+from drift import TokenBucket, WorkQueue, is_subset, run_workers
+from git_poller import GitRef, GitRefPoller, make_webhook_handler
+from idle_scaling import fetch_idle_seconds, make_activator_app, post_to_pods
+from kube_clients import KubeClients
 from kubernetes.client.rest import ApiException
-from streamlit_app_manifest_templating import template_deployment, template_ingress, template_service
+from metrics import (
+    APP_TIME_TO_READY,
+    DRIFT_REPAIRS,
+    POD_TIME_TO_READY,
+    STARTUP_PHASE_DURATION,
+    TIME_TO_READY,
+    instrument_handler,
+)
+from resource_recommender import ResourceRecommender
+from sharding import HashRing, OwnedDiffBaseStorage, OwnedProgressStorage, ShardCoordinator
+from startup_phases import STARTUP_LOG_TAIL_LINES, pod_condition_time, startup_phases
+from streamlit_app_manifest_templating import (
+    ACTIVITY_PORT,
+    GIT_REVISION_ANNOTATION,
+    RELOAD_ANNOTATION,
+    DeploymentTemplate,
+    activity_token,
+    hash_manifest,
+    make_hpa_name,
+    resolve_resources,
+    template_hpa,
+    template_ingress,
+    template_service,
+)
 from streamlit_app_spec_schema import StreamlitAppSpec
 from streamlit_operator_config import StreamlitOperatorConfig
 
+IDLE_CHECK_INTERVAL_SECONDS = 60
+RESOURCE_SAMPLE_INTERVAL_SECONDS = 60
+GIT_WEBHOOK_PATH = "/_operator/git-webhook"
+# Set on each StreamlitApp by the replica that owns it, and on the pod of the leader (selected by the webhook Service)
+SHARD_OWNER_ANNOTATION = "fetch.com/operator-shard"
+LEADER_LABEL = "fetch.com/operator-leader"
+# Set on a StreamlitApp (e.g. by the hub) to roll its pods, or to restart just the Streamlit process in each pod
+RESTARTED_AT_ANNOTATION = "fetch.com/restartedAt"
+RELOADED_AT_ANNOTATION = "fetch.com/reloadedAt"
+# Child events are delayed a little before the drift check, so that the events of one apply are checked together
+DRIFT_EVENT_DELAY_SECONDS = 5
+DRIFT_BACKOFF_BASE_SECONDS = 1
+DRIFT_BACKOFF_MAX_SECONDS = 300
+# Validated specs kept around, enough for every app of a large fleet so that a drift resync does not re-validate them
+SPEC_CACHE_SIZE = 16384
+
 config: StreamlitOperatorConfig
+activity_token_key: str | None = None
+kube: KubeClients
+resource_recommender: ResourceRecommender
+activator: web.AppRunner
+git_poller: GitRefPoller | None = None
+git_poller_task: asyncio.Task | None = None
+shards: ShardCoordinator | None = None
+shards_task: asyncio.Task | None = None
+drift_queue: WorkQueue | None = None
+drift_budget: TokenBucket
+drift_tasks: list[asyncio.Task] = []
+app_status: AppStatusWriter
+app_status_task: asyncio.Task | None = None
+indexed_apps: kopf.Index
+deployment_template: tuple[StreamlitOperatorConfig, DeploymentTemplate] | None = None
+live_children: dict[tuple[str, str], dict] = {}  # (kind, name) -> last seen body of the children of owned apps
+operator_started_at: datetime.datetime
+apps_ready: dict[str, str] = {}  # name -> creationTimestamp of apps whose time to ready has been recorded
+pods_ready: set[str] = set()  # uids of app pods whose startup phases have been recorded
 
 
 @kopf.on.startup()  # type: ignore
-def configure(settings: kopf.OperatorSettings, **_):  # noqa: ARG001
-    global config
+def configure(settings: kopf.OperatorSettings, **_):
+    global activity_token_key, config, kube, operator_started_at, resource_recommender
 
-    with open("/config/config.yaml") as f:
+    operator_started_at = datetime.datetime.now(datetime.UTC)
+    with open(os.environ.get("STREAMLIT_OPERATOR_CONFIG", "/config/config.yaml")) as f:
         config = StreamlitOperatorConfig(**yaml.safe_load(f))
 
     logging.info("Loaded config: %s", config)
-    _ = kubernetes.config.load_incluster_config()  # type: ignore
-    client = kubernetes.client.CustomObjectsApi()  # type: ignore
+    # From a Secret of the chart, so that it never shows up in the config or its log line above
+    activity_token_key = os.environ.get("ACTIVITY_TOKEN_KEY")
+    prometheus_client.start_http_server(config.metricsPort)
+    # In-cluster, unless a kubeconfig is given (KUBECONFIG), e.g. one for experiments/fake_kube_api.py
+    _ = kubernetes.config.load_config()  # type: ignore
+    kube = KubeClients(config.maxConcurrentReconciles)
+    resource_recommender = ResourceRecommender(
+        window_seconds=config.resourceRecommender.windowMinutes * 60,
+        min_samples=config.resourceRecommender.minSamples,
+        cpu_percentile=config.resourceRecommender.cpuPercentile,
+        memory_headroom=config.resourceRecommender.memoryHeadroom,
+    )
+
+    # With several replicas, only the leader bootstraps the hub (see lead)
+    if not config.sharding.enabled:
+        return bootstrap_hub()
+
+    # ...and only the owner of an app records it as handled
+    settings.persistence.diffbase_storage = OwnedDiffBaseStorage(owns_app)
+    settings.persistence.progress_storage = OwnedProgressStorage(owns_app)
+    return None
+
+
+def bootstrap_hub():
+    client = kube.custom
 
     group = "fetch.com"
     version = "v1"
@@ -40,6 +137,8 @@ def configure(settings: kopf.OperatorSettings, **_):  # noqa: ARG001
             "repo": config.gitRepo,
             "ref": config.gitRef,
             "codeDir": "streamlit-hub",
+            # The hub reads nothing outside its codeDir but the StreamlitApp spec schema, from the operator's code
+            "checkout": {"sparse": True, "filter": "blob:none", "extraPaths": ["streamlit-operator"]},
             "serviceAccountName": "streamlit-serviceaccount",
             "additionalEnv": [
                 {"name": "STREAMLIT_HUB_SUFFIX", "value": config.suffix},
@@ -78,105 +177,752 @@ def configure(settings: kopf.OperatorSettings, **_):  # noqa: ARG001
         raise kopf.PermanentError(f"Error creating or patching StreamlitApp: {e}") from e
 
 
-@kopf.on.create("streamlit-apps")  # type: ignore
-def create_fn(spec, name, namespace, logger, **kwargs):  # noqa: ARG001
+def owns_app(name, **_) -> bool:
+    return shards is None or shards.owns(name)
+
+
+@kopf.on.create("streamlit-apps", when=owns_app)  # type: ignore
+@instrument_handler("create_fn")
+async def create_fn(spec, name, namespace, body, patch, logger, **kwargs):  # noqa: ARG001
     # Override the namespace, since the operator won't have permissions to create the apps anywhere else anyway
     namespace = "streamlit"
     dns_name = make_dns_name(name)
+    spec = parse_app_spec(name, spec)
+
+    children = template_children(name, spec, dns_name, body)
+
+    # The children are independent of each other, so apply them concurrently
+    async with kube.reconcile_slot(), reporting_sync_errors(name):
+        applied = await asyncio.gather(*(kube.call(kube.apply, manifest, namespace) for manifest in children.values()))
+    for child, obj in zip(children, applied, strict=True):
+        logger.info("Created %s: %s", child, obj["metadata"]["name"])
+
+    patch.status["manifestHashes"] = {child: hash_manifest(manifest) for child, manifest in children.items()}
+    patch.status.update(synced_status(name, spec, body))
+
+
+# Also on resume, i.e. for every app when the operator starts: a new operator version or config can template different
+# children from an unchanged spec, and only re-templating every app notices (by its manifest hashes) and applies them
+@kopf.on.resume("streamlit-apps", when=owns_app)  # type: ignore
+@kopf.on.update("streamlit-apps", when=owns_app)  # type: ignore
+@instrument_handler("update_fn")
+async def update_fn(spec, name, status, namespace, body, patch, logger, **kwargs):  # noqa: ARG001
+    # Override the namespace, since the operator won't have permissions to create the apps anywhere else anyway
+    namespace = "streamlit"
+    dns_name = make_dns_name(name)
+    spec = parse_app_spec(name, spec)
+
+    # Keep sleeping apps asleep, unless idle scaling was just turned off
+    asleep = spec.idleScaling.enabled and status.get("idle", {}).get("asleep", False)
+    if not spec.idleScaling.enabled and status.get("idle"):
+        patch.status["idle"] = None
+
+    children = template_children(name, spec, dns_name, body, asleep=asleep)
+
+    # Only write the children whose templated manifest actually changed since the last apply
+    hashes = {child: hash_manifest(manifest) for child, manifest in children.items()}
+    applied_hashes = status.get("manifestHashes", {})
+    changed = [child for child in children if hashes[child] != applied_hashes.get(child)]
+    removed = [child for child in applied_hashes if child not in children]
+    if not changed and not removed:
+        logger.info("No changes to children of %s, skipping", name)
+        patch.status.update(synced_status(name, spec, body))
+        return
+
+    async with kube.reconcile_slot(), reporting_sync_errors(name):
+        await asyncio.gather(
+            *(kube.call(kube.apply, children[child], namespace) for child in changed),
+            *(delete_child(child, name, namespace) for child in removed),
+        )
+    for child in changed:
+        logger.info("Applied %s: %s", child, children[child]["metadata"]["name"])
+    for child in removed:
+        logger.info("Deleted %s of %s", child, name)
+
+    # The status is merge-patched, so removed children must be nulled out explicitly
+    patch.status["manifestHashes"] = {**dict.fromkeys(removed), **hashes}
+    patch.status.update(synced_status(name, spec, body))
+
+
+def parse_app_spec(name: str, spec) -> StreamlitAppSpec:
     try:
-        spec = StreamlitAppSpec(**(spec or {}))
+        return parse_spec(spec)
+    except kopf.PermanentError as e:
+        app_status.update(name, conditions={"Synced": ("False", "InvalidSpec", str(e))})
+        raise
+
+
+@contextlib.asynccontextmanager
+async def reporting_sync_errors(name: str) -> AsyncIterator[None]:
+    """Set the Synced condition of ``name`` to False if applying its children fails (kopf then retries)."""
+    try:
+        yield
+    except ApiException as e:
+        app_status.update(name, conditions={"Synced": ("False", "ApplyFailed", f"{e.status} {e.reason}")})
+        raise
+
+
+def synced_status(name: str, spec: StreamlitAppSpec, body) -> dict:
+    """Status patch of an app whose children were just applied, folded into the handler's own patch by kopf."""
+    fields = {"observedGeneration": body["metadata"].get("generation"), "dnsName": make_dns_name(name)}
+    commit = git_poller.revision((spec.repo, spec.ref)) if git_poller is not None else None
+    if commit is not None:
+        fields["commit"] = commit
+    return app_status.take(name, fields, {"Synced": ("True", "ChildrenApplied", "")})
+
+
+def parse_spec(spec) -> StreamlitAppSpec:
+    """Validate ``spec``, reusing the result for a spec seen before. The result is shared, so never modify it."""
+    try:
+        parsed = validate_spec(json.dumps(dict(spec or {})))
     except pydantic.ValidationError as e:
         raise kopf.PermanentError(f"Spec validation error: {e}") from e
+    profile = parsed.resources.profile
+    if profile is not None and profile not in config.resourceProfiles:
+        raise kopf.PermanentError(
+            f"Unknown resource profile {profile!r}, expected one of {sorted(config.resourceProfiles)}"
+        )
+    return parsed
+
+
+@functools.lru_cache(maxsize=SPEC_CACHE_SIZE)
+def validate_spec(spec_json: str) -> StreamlitAppSpec:
+    return StreamlitAppSpec.model_validate_json(spec_json)
+
+
+def get_deployment_template() -> DeploymentTemplate:
+    """The Deployment template of the current operator config, built once."""
+    global deployment_template
+
+    if deployment_template is None or deployment_template[0] is not config:
+        template = DeploymentTemplate(
+            config.gitSyncAuthConfig,
+            config.dependencyCache,
+            git_poller=config.gitPoller,
+            git_cache=config.gitCache,
+            activity_token_key=activity_token_key,
+        )
+        deployment_template = (config, template)
+    return deployment_template[1]
+
+
+def template_children(
+    name: str,
+    spec: StreamlitAppSpec,
+    dns_name: str,
+    owner,
+    *,
+    asleep: bool = False,
+) -> dict[str, dict]:
+    children = {
+        "deployment": get_deployment_template().render(
+            name,
+            spec,
+            resources=resolve_resources(spec.resources, config.resourceProfiles, config.defaultResourceProfile),
+            restarted_at=owner["metadata"].get("annotations", {}).get(RESTARTED_AT_ANNOTATION),
+            asleep=asleep,
+        ),
+        "service": template_service(name),
+        "ingress": template_ingress(name, spec, dns_name, asleep=asleep),
+    }
+    hpa_data = template_hpa(name, spec)
+    if hpa_data is not None:
+        children["hpa"] = hpa_data
+
+    # One call for all children, so the owner reference and labels are worked out once
+    kopf.adopt(list(children.values()), owner=owner)
+    return children
+
+
+async def delete_child(child: str, name: str, namespace: str) -> None:
+    # Only optional children can disappear from the templated set
+    assert child == "hpa", f"Unexpected removed child {child}"
+    try:
+        await kube.call(
+            kube.autoscaling.delete_namespaced_horizontal_pod_autoscaler,
+            name=make_hpa_name(name),
+            namespace=namespace,
+        )
+    except ApiException as e:
+        if e.status != 404:
+            raise
+
+
+def idle_scaling_enabled(spec, **_) -> bool:
+    return spec.get("idleScaling", {}).get("enabled", False)
+
+
+@kopf.timer(  # type: ignore
+    "streamlit-apps",
+    interval=IDLE_CHECK_INTERVAL_SECONDS,
+    when=kopf.all_([idle_scaling_enabled, owns_app]),
+)
+@instrument_handler("idle_fn")
+async def idle_fn(spec, status, name, namespace, body, patch, logger, **kwargs):  # noqa: ARG001
+    # Override the namespace, since the operator won't have permissions to create the apps anywhere else anyway
+    namespace = "streamlit"
+    if status.get("idle", {}).get("asleep", False):
+        return
+
+    try:
+        spec = parse_spec(spec)
+    except kopf.PermanentError:
+        return  # Reported by create_fn/update_fn
+
+    pods = await kube.call(kube.core.list_namespaced_pod, namespace=namespace, label_selector=f"app={name}")
+    pod_ips = [pod.status.pod_ip for pod in pods.items if pod.status.phase == "Running" and pod.status.pod_ip]
+    if not pod_ips:
+        return
+
+    idle_seconds = await fetch_idle_seconds(pod_ips, ACTIVITY_PORT)
+    if idle_seconds is None or idle_seconds < spec.idleScaling.idleTimeoutMinutes * 60:
+        return
+
+    logger.info("%s has been idle for %ds, scaling to zero", name, idle_seconds)
+    children = template_children(name, spec, make_dns_name(name), body, asleep=True)
+    # Point the ingress at the activator first, so no request reaches a pod that is shutting down
+    async with kube.reconcile_slot():
+        await kube.call(kube.apply, children["ingress"], namespace)
+        await kube.call(kube.apply, children["deployment"], namespace)
+
+    patch.status["manifestHashes"] = {child: hash_manifest(manifest) for child, manifest in children.items()}
+    patch.status["idle"] = {"asleep": True, "since": now()}
+
+
+def resource_recommender_enabled(**_) -> bool:
+    return config.resourceRecommender.enabled
+
+
+@kopf.timer(  # type: ignore
+    "streamlit-apps",
+    interval=RESOURCE_SAMPLE_INTERVAL_SECONDS,
+    when=kopf.all_([resource_recommender_enabled, owns_app]),
+)
+@instrument_handler("recommend_fn")
+async def recommend_fn(name, status, patch, **_):
+    try:
+        pod_metrics = await kube.call(
+            kube.custom.list_namespaced_custom_object,
+            group="metrics.k8s.io",
+            version="v1beta1",
+            namespace="streamlit",
+            plural="pods",
+            label_selector=f"app={name}",
+        )
+    except ApiException as e:
+        if e.status == 404:
+            raise kopf.TemporaryError("metrics.k8s.io is not served, is metrics-server installed?", delay=600) from e
+        raise
+
+    resource_recommender.add(name, pod_metrics["items"])
+    recommendation = resource_recommender.recommend(name)
+    # Only write the status when a suggestion changes, not on every sample
+    current = status.get("resourceRecommendation") or {}
+    if recommendation is None or all(current.get(field) == value for field, value in recommendation.items()):
+        return
+    patch.status["resourceRecommendation"] = {
+        **recommendation,
+        "samples": resource_recommender.samples(name),
+        "updatedAt": now(),
+    }
+
+
+async def wake_app(name: str) -> None:
+    namespace = "streamlit"
+    try:
+        body = await kube.call(
+            kube.custom.get_namespaced_custom_object,
+            group="fetch.com",
+            version="v1",
+            namespace=namespace,
+            plural="streamlit-apps",
+            name=name,
+        )
+        if not body.get("status", {}).get("idle", {}).get("asleep", False):
+            return
+
+        logging.info("Waking up %s", name)
+        # Tells drift detection not to put the children back to sleep while they are being woken up
+        await patch_app_status(name, {"idle": {"waking": now()}})
+        spec = StreamlitAppSpec(**body["spec"])
+        children = template_children(name, spec, make_dns_name(name), body)
+
+        async with kube.reconcile_slot():
+            await kube.call(kube.apply, children["deployment"], namespace)
+
+        # Keep serving the holding page until a pod is ready, rather than routing users to an app with no endpoints
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + spec.rollout.startupTimeoutSeconds
+        while loop.time() < deadline:
+            deployment = await kube.call(kube.apps.read_namespaced_deployment, name=name, namespace=namespace)
+            if deployment.status.ready_replicas:
+                break
+            await asyncio.sleep(2)
+
+        async with kube.reconcile_slot():
+            await kube.call(kube.apply, children["ingress"], namespace)
+        await patch_app_status(
+            name,
+            {
+                "idle": {"asleep": False, "since": now(), "waking": None},
+                "manifestHashes": {child: hash_manifest(manifest) for child, manifest in children.items()},
+            },
+        )
+        logging.info("Woke up %s", name)
+    except Exception:
+        logging.exception("Error waking up %s", name)
+        with contextlib.suppress(ApiException):
+            await patch_app_status(name, {"idle": {"waking": None}})
+
+
+async def patch_app_status(name: str, status: dict) -> None:
+    """Merge-patch the status of a StreamlitApp from outside of a kopf handler."""
+    await kube.call(
+        kube.custom.patch_namespaced_custom_object_status,
+        group="fetch.com",
+        version="v1",
+        namespace="streamlit",
+        plural="streamlit-apps",
+        name=name,
+        body={"status": status},
+    )
+
+
+def resolve_app_name(host: str) -> str | None:
+    suffix = f"{config.suffix}.{config.baseDnsRecord}"
+    if not host.endswith(suffix):
+        return None
+    return host.removesuffix(suffix)
+
+
+@kopf.index("streamlit-apps")  # type: ignore
+def git_refs_idx(spec, name, **_):
+    return {(spec.get("repo"), spec.get("ref")): name}
+
+
+async def trigger_git_sync(git_ref: GitRef, revision: str, names: list[str]) -> None:
+    """Make the pods of the apps tracking ``git_ref`` sync its new revision right away.
+
+    Like a reload (see reload_fn), the revision goes to each running pod over HTTP, and the pod annotation is the
+    fallback for pods that could not be reached.
+    """
+    pods = await annotate_app_pods(names, {GIT_REVISION_ANNOTATION: revision})
+    reached = sum(await asyncio.gather(*(send_to_pods(name, pods, "/revision", revision) for name in names)))
+    for name in names:
+        app_status.update(name, {"commit": revision})
+    logging.info(
+        "Triggered git-sync of %s@%s to %s in %d pods of %s, %d of them directly",
+        *git_ref,
+        revision,
+        len(pods),
+        names,
+        reached,
+    )
+
+
+@kopf.on.field("streamlit-apps", field=("metadata", "annotations", RELOADED_AT_ANNOTATION), when=owns_app)  # type: ignore
+async def reload_fn(name, new, logger, **_):
+    """Have launch.sh restart the Streamlit process of each pod in place, without a new pod or reinstalling anything.
 
-    # Template the deployment
-    deployment_data = template_deployment(name, spec, dns_name, config.gitSyncAuthConfig)
-    kopf.adopt(deployment_data)
+    The request goes to each running pod over HTTP, which launch.sh acts on within a second. The pod annotation is the
+    fallback for pods that could not be reached, as the kubelet takes up to a minute or so to refresh it in the pod.
+    """
+    if not new:
+        return
+    pods = await annotate_app_pods([name], {RELOAD_ANNOTATION: new})
+    reached = await send_to_pods(name, pods, "/reload", new)
+    logger.info("Requested a code reload in %d pods, %d of them directly", len(pods), reached)
 
-    # Template the service
-    service_data = template_service(name, spec)
-    kopf.adopt(service_data)
 
-    # Template the ingress
-    ingress_data = template_ingress(name, spec, dns_name)
-    kopf.adopt(ingress_data)
+async def send_to_pods(name: str, pods: list, path: str, data: str) -> int:
+    """POST ``data`` to ``path`` of activity.py in the running pods of the app ``name`` among ``pods``.
 
-    api = kubernetes.client.CoreV1Api()  # type: ignore
-    apps_api = kubernetes.client.AppsV1Api()  # type: ignore
-    networking_api = kubernetes.client.NetworkingV1Api()  # type: ignore
+    Returns how many pods took it.
+    """
+    pod_ips = [
+        pod.status.pod_ip
+        for pod in pods
+        if (pod.metadata.labels or {}).get("app") == name and pod.status.phase == "Running" and pod.status.pod_ip
+    ]
+    if not pod_ips or not activity_token_key:
+        return 0
+    return await post_to_pods(pod_ips, ACTIVITY_PORT, path, data, activity_token(activity_token_key, name))
 
-    deployment_obj = apps_api.create_namespaced_deployment(namespace=namespace, body=deployment_data)
-    logger.info("Created deployment: %s", deployment_obj.metadata.name)
 
-    service_obj = api.create_namespaced_service(namespace=namespace, body=service_data)
-    logger.info("Created service: %s", service_obj.metadata.name)
+async def annotate_app_pods(names: list[str], annotations: dict[str, str]) -> list:
+    """Annotate the pods of the apps ``names``, which launch.sh sees through /etc/podinfo. Returns the pods."""
+    namespace = "streamlit"
+    pod_lists = await asyncio.gather(
+        *(kube.call(kube.core.list_namespaced_pod, namespace=namespace, label_selector=f"app={name}") for name in names)
+    )
+    pods = [pod for pod_list in pod_lists for pod in pod_list.items]
+    results = await asyncio.gather(
+        *(
+            kube.call(
+                kube.core.patch_namespaced_pod,
+                name=pod.metadata.name,
+                namespace=namespace,
+                body={"metadata": {"annotations": annotations}},
+            )
+            for pod in pods
+        ),
+        return_exceptions=True,
+    )
+    for pod, result in zip(pods, results, strict=True):
+        if isinstance(result, Exception):
+            logging.warning("Could not annotate pod %s with %s: %s", pod.metadata.name, annotations, result)
+    return pods
+
+
+@kopf.index("streamlit-apps")  # type: ignore
+def app_created_idx(name, meta, **_):
+    return {name: meta["creationTimestamp"]}
+
+
+def owner_app_name(body) -> str | None:
+    for ref in body.get("metadata", {}).get("ownerReferences", []):
+        if ref.get("kind") == "StreamlitApp":
+            return ref.get("name")
+    return None
+
+
+def owned_by_streamlit_app(body, **_) -> bool:
+    return owner_app_name(body) is not None
 
-    ingress_obj = networking_api.create_namespaced_ingress(namespace=namespace, body=ingress_data)
-    logger.info("Created ingress: %s", ingress_obj.metadata.name)
 
+@kopf.on.event("apps", "v1", "deployments", when=kopf.all_([owned_by_streamlit_app, owns_app]))  # type: ignore
+async def deployment_event_fn(type, name, body, status, app_created_idx, **_):  # noqa: A002
+    if type != "DELETED":
+        app_status.update(owner_app_name(body), *deployment_status(body))
+
+    created = next(iter(app_created_idx.get(name, [])), None)
+    if created is None or apps_ready.get(name) == created or not (status or {}).get("readyReplicas"):
+        return
+    apps_ready[name] = created
+
+    # Apps created before this operator process started were already (or are being) measured elsewhere
+    created_at = datetime.datetime.fromisoformat(created)
+    if created_at < operator_started_at:
+        return
+    time_to_ready = (datetime.datetime.now(datetime.UTC) - created_at).total_seconds()
+    TIME_TO_READY.observe(time_to_ready)
+    APP_TIME_TO_READY.labels(name).set(time_to_ready)
+    logging.info("%s became ready %.1fs after creation", name, time_to_ready)
+
+
+def app_pod(labels, **_) -> bool:
+    name = labels.get("app")
+    return name is not None and owns_app(name)
+
+
+@kopf.on.event("", "v1", "pods", labels={"app.kubernetes.io/name": kopf.PRESENT}, when=app_pod)  # type: ignore
+async def pod_event_fn(type, body, name, uid, labels, logger, **_):  # noqa: A002
+    """Record where the startup of each new app pod went, in the app's status and the startup metrics."""
+    if type == "DELETED":
+        return
+    if uid in pods_ready or pod_condition_time(body, "Ready") is None:
+        return
+    pods_ready.add(uid)
+    # Pods that started before this operator process were already (or are being) measured elsewhere
+    if datetime.datetime.fromisoformat(body["metadata"]["creationTimestamp"]) < operator_started_at:
+        return
+
+    try:
+        log = await kube.call(
+            kube.core.read_namespaced_pod_log,
+            name=name,
+            namespace="streamlit",
+            container="streamlit",
+            tail_lines=STARTUP_LOG_TAIL_LINES,
+        )
+    except ApiException as e:
+        logger.warning("Could not read the startup phases from the log of %s: %s", name, e.reason)
+        log = ""
+    startup = startup_phases(body, log)
+
+    for phase, seconds in startup["phases"].items():
+        STARTUP_PHASE_DURATION.labels(phase).observe(seconds)
+    if startup["totalSeconds"] is not None:
+        POD_TIME_TO_READY.observe(startup["totalSeconds"])
+    logger.info("Started up in %ss: %s", startup["totalSeconds"], startup["phases"])
+    try:
+        await patch_app_status(labels["app"], {"startup": startup})
+    except ApiException as e:
+        if e.status != 404:
+            raise
+
+
+@kopf.index("streamlit-apps")  # type: ignore
+def app_status_idx(name, status, **_):
+    # What the status writer compares its updates against, to only patch what changed
+    return {name: {key: status[key] for key in STATUS_FIELDS if key in status}}
+
+
+@kopf.on.event("", "v1", "pods", labels={"app.kubernetes.io/name": kopf.PRESENT})  # type: ignore
+async def pod_deleted_fn(type, uid, **_):  # noqa: A002
+    # Unfiltered by ownership, so a replica also forgets the pods of apps that have since moved to another replica
+    if type == "DELETED":
+        pods_ready.discard(uid)
+
+
+# Unfiltered by ownership too: what a replica kept about an app while it owned it must go when the app does
+@kopf.on.event("streamlit-apps")  # type: ignore
+async def app_event_fn(type, name, **_):  # noqa: A002
+    if type == "DELETED":
+        app_status.forget(name)
+        apps_ready.pop(name, None)
+        with contextlib.suppress(KeyError):
+            APP_TIME_TO_READY.remove(name)
+
+
+@kopf.index("streamlit-apps")  # type: ignore
+def apps_idx(name, body, **_):
+    # Just what drift detection needs to template the children, without reading the app back from the API
     return {
-        "ingress-name": ingress_obj.metadata.name,
-        "service-name": service_obj.metadata.name,
-        "deployment-name": deployment_obj.metadata.name,
-        "streamlit-app-name": name,
-        "dns-name": dns_name,
+        name: {
+            "apiVersion": body["apiVersion"],
+            "kind": body["kind"],
+            "metadata": {
+                "name": name,
+                "namespace": body["metadata"]["namespace"],
+                "uid": body["metadata"]["uid"],
+                # Copied onto the children by kopf.adopt and template_children
+                "labels": dict(body["metadata"].get("labels", {})),
+                "annotations": {
+                    key: value
+                    for key, value in body["metadata"].get("annotations", {}).items()
+                    if key == RESTARTED_AT_ANNOTATION
+                },
+            },
+            "spec": dict(body.get("spec", {})),
+            "status": {"idle": dict(body.get("status", {}).get("idle") or {})},
+        }
     }
 
 
-@kopf.on.update("streamlit-apps")
-def update_fn(spec, status, namespace, logger, **kwargs):  # noqa: ARG001
-    # Override the namespace, since the operator won't have permissions to create the apps anywhere else anyway
+def drift_watched(body, **_) -> bool:
+    name = owner_app_name(body)
+    return config.driftDetection.enabled and name is not None and owns_app(name)
+
+
+@kopf.on.event("autoscaling", "v2", "horizontalpodautoscalers", when=drift_watched)  # type: ignore
+@kopf.on.event("networking.k8s.io", "v1", "ingresses", when=drift_watched)  # type: ignore
+@kopf.on.event("", "v1", "services", when=drift_watched)  # type: ignore
+@kopf.on.event("apps", "v1", "deployments", when=drift_watched)  # type: ignore
+async def child_event_fn(type, body, name, **_):  # noqa: A002
+    key = (body["kind"], name)
+    if type == "DELETED":
+        live_children.pop(key, None)
+    else:
+        live_children[key] = dict(body)
+    if drift_queue is not None:
+        drift_queue.add(owner_app_name(body), delay=DRIFT_EVENT_DELAY_SECONDS)
+
+
+async def repair_drift(name: str) -> None:
+    """Re-apply the children of ``name`` whose live state (as last seen by the watches) differs from the template."""
     namespace = "streamlit"
+    app = next(iter(indexed_apps.get(name, [])), None)
+    if app is None or not owns_app(name):
+        return  # Deleted, or moved to another replica
+    if app["status"]["idle"].get("waking"):
+        return  # wake_app is moving the children from asleep to awake
 
     try:
-        spec = StreamlitAppSpec(**(spec or {}))
-    except pydantic.ValidationError as e:
-        raise kopf.PermanentError(f"Spec validation error: {e}") from e
+        spec = parse_spec(app["spec"])
+    except kopf.PermanentError:
+        return  # Reported by create_fn/update_fn
+    asleep = spec.idleScaling.enabled and app["status"]["idle"].get("asleep", False)
+
+    children = template_children(name, spec, make_dns_name(name), app, asleep=asleep)
+    drifted = [
+        child
+        for child, manifest in children.items()
+        if not is_subset(manifest, live_children.get((manifest["kind"], manifest["metadata"]["name"])))
+    ]
+    for child in drifted:
+        # The budget is shared by all apps, so a mass edit or deletion cannot turn into a burst of writes
+        await drift_budget.acquire()
+        logging.info("%s of %s drifted from its template, re-applying", child, name)
+        async with kube.reconcile_slot():
+            await kube.call(kube.apply, children[child], namespace)
+        DRIFT_REPAIRS.labels(child).inc()
+
+
+async def resync_drift() -> None:
+    while True:
+        await asyncio.sleep(config.driftDetection.resyncIntervalSeconds)
+        for name in list(indexed_apps):
+            if owns_app(name):
+                drift_queue.add(name)
 
-    name = status["create_fn"]["streamlit-app-name"]
-    dns_name = make_dns_name(name)
 
-    # Template the deployment
-    deployment_name = status["create_fn"]["deployment-name"]
-    assert deployment_name == name, "Deployment name mismatch!"
-    deployment_data = template_deployment(name, spec, dns_name, config.gitSyncAuthConfig)
-    kopf.adopt(deployment_data)
-
-    # Template the service
-    service_name = status["create_fn"]["service-name"]
-    assert service_name == f"{name}-service", "Service name mismatch!"
-    service_data = template_service(name, spec)
-    kopf.adopt(service_data)
-
-    # Template the ingress
-    ingress_name = status["create_fn"]["ingress-name"]
-    assert ingress_name == f"{name}-ing", "Ingress name mismatch!"
-    ingress_data = template_ingress(name, spec, dns_name)
-    kopf.adopt(ingress_data)
-
-    api = kubernetes.client.CoreV1Api()  # type: ignore
-    apps_api = kubernetes.client.AppsV1Api()  # type: ignore
-    networking_api = kubernetes.client.NetworkingV1Api()  # type: ignore
-
-    # Replace the deployment
-    deployment_obj = apps_api.replace_namespaced_deployment(
-        name=deployment_name,
-        namespace=namespace,
-        body=deployment_data,
+@kopf.on.startup()  # type: ignore
+async def start_status_writer(app_status_idx, **_):
+    global app_status, app_status_task
+
+    app_status = AppStatusWriter(
+        patch_app_status,
+        lambda name: next(iter(app_status_idx.get(name, [])), {}),
+        config.statusUpdates.debounceSeconds,
     )
-    logger.info("Replaced deployment: %s", deployment_obj.metadata.name)
+    app_status_task = asyncio.create_task(app_status.run(config.statusUpdates.workers), name="status-writer")
+
+
+@kopf.on.startup()  # type: ignore
+async def start_drift_detection(apps_idx, **_):
+    global drift_queue, drift_budget, indexed_apps
+
+    if not config.driftDetection.enabled:
+        return
+
+    indexed_apps = apps_idx
+    drift_queue = WorkQueue(DRIFT_BACKOFF_BASE_SECONDS, DRIFT_BACKOFF_MAX_SECONDS)
+    drift_budget = TokenBucket(config.driftDetection.maxRepairsPerSecond, config.driftDetection.repairBurst)
+    drift_tasks.append(
+        asyncio.create_task(run_workers(drift_queue, repair_drift, config.driftDetection.workers), name="drift-workers")
+    )
+    drift_tasks.append(asyncio.create_task(resync_drift(), name="drift-resync"))
+
+
+@kopf.on.startup()  # type: ignore
+async def start_git_poller(git_refs_idx, **_):
+    global git_poller, git_poller_task
+
+    if not config.gitPoller.enabled:
+        return
 
-    # Replace the service
-    service_obj = api.replace_namespaced_service(name=service_name, namespace=namespace, body=service_data)
-    logger.info("Replaced service: %s", service_obj.metadata.name)
+    # The index is live: kopf keeps it current as StreamlitApps are created, changed and deleted
+    git_poller = GitRefPoller(git_refs_idx, config.gitPoller.intervalSeconds, trigger_git_sync)
+    # With several replicas, only the leader polls (see lead)
+    if not config.sharding.enabled:
+        git_poller_task = asyncio.create_task(git_poller.run(), name="git-poller")
 
-    # Replace the ingress
-    ingress_obj = networking_api.replace_namespaced_ingress(
-        name=ingress_name,
+
+@kopf.on.startup()  # type: ignore
+async def start_activator(**_):
+    global activator
+
+    routes = []
+    # The activator also serves every sleeping app's host, so the webhook is only there when it can be authenticated
+    if git_poller is not None and config.gitPoller.webhookSecret:
+        routes.append(web.post(GIT_WEBHOOK_PATH, make_webhook_handler(git_poller, config.gitPoller.webhookSecret)))
+    elif git_poller is not None:
+        logging.info("No gitPoller.webhookSecret, not serving the git webhook")
+
+    activator = web.AppRunner(make_activator_app(resolve_app_name, wake_app, routes), access_log=None)
+    await activator.setup()
+    await web.TCPSite(activator, "0.0.0.0", config.activatorPort).start()
+    logging.info("Activator listening on port %d", config.activatorPort)
+
+
+@kopf.on.startup()  # type: ignore
+async def start_sharding(**_):
+    global shards, shards_task
+
+    if not config.sharding.enabled:
+        return
+
+    shards = ShardCoordinator(
+        kube,
+        "streamlit",
+        os.environ.get("POD_NAME") or socket.gethostname(),
+        config.sharding.leaseDurationSeconds,
+        config.sharding.renewIntervalSeconds,
+        on_members_changed=claim_apps,
+        on_leading_changed=lead,
+    )
+    # Join before kopf starts watching StreamlitApps, so the ownership filters see the ring from the first event
+    await shards.tick()
+    shards_task = asyncio.create_task(shards.run(), name="shard-coordinator")
+
+
+async def claim_apps(previous: HashRing, ring: HashRing) -> None:  # noqa: ARG001
+    """Annotate the apps this replica now owns but another replica handled last.
+
+    kopf only re-evaluates handler filters on events, so without a change to the app its previous owner would keep its
+    idle timer running, and the new owner would not start one (or retry a failed reconcile) until the app next changes.
+    """
+    namespace = "streamlit"
+    apps = await kube.call(
+        kube.custom.list_namespaced_custom_object,
+        group="fetch.com",
+        version="v1",
         namespace=namespace,
-        body=ingress_data,
+        plural="streamlit-apps",
     )
-    logger.info("Replaced ingress: %s", ingress_obj.metadata.name)
+    gained = [
+        app["metadata"]["name"]
+        for app in apps["items"]
+        if shards.owns(app["metadata"]["name"])
+        and app["metadata"].get("annotations", {}).get(SHARD_OWNER_ANNOTATION) != shards.identity
+    ]
+    results = await asyncio.gather(
+        *(
+            kube.call(
+                kube.custom.patch_namespaced_custom_object,
+                group="fetch.com",
+                version="v1",
+                namespace=namespace,
+                plural="streamlit-apps",
+                name=name,
+                body={"metadata": {"annotations": {SHARD_OWNER_ANNOTATION: shards.identity}}},
+            )
+            for name in gained
+        ),
+        return_exceptions=True,
+    )
+    for name, result in zip(gained, results, strict=True):
+        if isinstance(result, Exception):
+            logging.warning("Could not claim %s: %s", name, result)
+    logging.info("Claimed %d of %d StreamlitApps", len(gained), len(apps["items"]))
+
+
+async def lead(leading: bool) -> None:  # noqa: FBT001
+    """Start or stop the singleton work of the leader replica."""
+    global git_poller_task
+
+    if leading:
+        try:
+            await kube.call(bootstrap_hub)
+        except kopf.PermanentError:
+            logging.exception("Error bootstrapping the hub")
+        if git_poller is not None:
+            git_poller_task = asyncio.create_task(git_poller.run(), name="git-poller")
+    elif git_poller_task is not None:
+        git_poller_task.cancel()
+        git_poller_task = None
+
+    # Label the leader pod, so that the git webhook reaches the replica that runs the poller
+    try:
+        await kube.call(
+            kube.core.patch_namespaced_pod,
+            name=shards.identity,
+            namespace="streamlit",
+            body={"metadata": {"labels": {LEADER_LABEL: "true" if leading else None}}},
+        )
+    except ApiException:
+        logging.warning("Could not label the operator pod as %s", "leader" if leading else "follower", exc_info=True)
+
+
+@kopf.on.cleanup()  # type: ignore
+async def cleanup(**_):
+    for task in drift_tasks:
+        task.cancel()
+    if app_status_task is not None:
+        app_status_task.cancel()
+    if shards_task is not None:
+        shards_task.cancel()
+        await shards.leave()
+    if git_poller_task is not None:
+        git_poller_task.cancel()
+    await activator.cleanup()
+    kube.close()
 
 
 def make_dns_name(name: str) -> str:
     return f"{name}{config.suffix}.{config.baseDnsRecord}"
+
+
+def now() -> str:
+    return datetime.datetime.now(datetime.UTC).isoformat()
@@ -0,0 +1,119 @@
+import functools
+import time
+from collections.abc import Callable
+
+import kopf
+from prometheus_client import Counter, Gauge, Histogram
+
+# Reconciles take from milliseconds to minutes (waking an app waits for its pod), API calls are much faster
+HANDLER_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+API_CALL_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TIME_TO_READY_BUCKETS = (10, 20, 30, 60, 90, 120, 180, 240, 300, 450, 600, 900, 1200, 1800)
+STARTUP_PHASE_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 90, 120, 180, 300, 600, 900)
+
+HANDLER_DURATION = Histogram(
+    "streamlit_operator_handler_duration_seconds",
+    "Duration of kopf handler invocations.",
+    ["handler"],
+    buckets=HANDLER_BUCKETS,
+)
+HANDLER_RETRIES = Counter(
+    "streamlit_operator_handler_retries_total",
+    "Handler invocations that were retries of an earlier failed attempt.",
+    ["handler"],
+)
+HANDLER_ERRORS = Counter(
+    "streamlit_operator_handler_errors_total",
+    "Handler invocations that raised, by kind of error (permanent, temporary or unexpected).",
+    ["handler", "kind"],
+)
+API_CALL_DURATION = Histogram(
+    "streamlit_operator_api_call_duration_seconds",
+    "Latency of Kubernetes API calls made by the operator.",
+    ["operation"],
+    buckets=API_CALL_BUCKETS,
+)
+API_CALL_ERRORS = Counter(
+    "streamlit_operator_api_call_errors_total",
+    "Kubernetes API calls made by the operator that failed.",
+    ["operation"],
+)
+RECONCILES_WAITING = Gauge(
+    "streamlit_operator_reconciles_waiting",
+    "Reconciles waiting for one of the maxConcurrentReconciles slots.",
+)
+RECONCILES_ACTIVE = Gauge(
+    "streamlit_operator_reconciles_active",
+    "Reconciles currently holding a slot.",
+)
+DRIFT_QUEUE_DEPTH = Gauge(
+    "streamlit_operator_drift_queue_depth",
+    "StreamlitApps queued for a drift check.",
+)
+DRIFT_REPAIRS = Counter(
+    "streamlit_operator_drift_repairs_total",
+    "Children of StreamlitApps re-applied because they had drifted from their templated manifest.",
+    ["child"],
+)
+STATUS_QUEUE_DEPTH = Gauge(
+    "streamlit_operator_status_queue_depth",
+    "StreamlitApps with status updates waiting to be written.",
+)
+STATUS_UPDATES = Counter(
+    "streamlit_operator_status_updates_total",
+    "Status updates of StreamlitApps, before they are coalesced into patches.",
+)
+STATUS_PATCHES = Counter(
+    "streamlit_operator_status_patches_total",
+    "Status patches of StreamlitApps written by the operator, outside of kopf handlers.",
+)
+TIME_TO_READY = Histogram(
+    "streamlit_app_time_to_ready_seconds",
+    "Time from StreamlitApp creation until its Deployment first has a ready pod.",
+    buckets=TIME_TO_READY_BUCKETS,
+)
+APP_TIME_TO_READY = Gauge(
+    "streamlit_app_last_time_to_ready_seconds",
+    "Time from StreamlitApp creation until its Deployment first had a ready pod, per app.",
+    ["app"],
+)
+POD_TIME_TO_READY = Histogram(
+    "streamlit_app_pod_time_to_ready_seconds",
+    "Time from the creation of a Streamlit app pod until it first became ready.",
+    buckets=TIME_TO_READY_BUCKETS,
+)
+STARTUP_PHASE_DURATION = Histogram(
+    "streamlit_app_startup_phase_seconds",
+    "Time Streamlit app pods spend in each phase of their startup (scheduling, containerStart, clone, dependencies, "
+    "server).",
+    ["phase"],
+    buckets=STARTUP_PHASE_BUCKETS,
+)
+
+
+def instrument_handler(handler: str) -> Callable:
+    """Record duration, retries and errors of an async kopf handler under the ``handler`` label."""
+
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if kwargs.get("retry", 0) > 0:
+                HANDLER_RETRIES.labels(handler).inc()
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            except kopf.PermanentError:
+                HANDLER_ERRORS.labels(handler, "permanent").inc()
+                raise
+            except kopf.TemporaryError:
+                HANDLER_ERRORS.labels(handler, "temporary").inc()
+                raise
+            except Exception:
+                HANDLER_ERRORS.labels(handler, "unexpected").inc()
+                raise
+            finally:
+                HANDLER_DURATION.labels(handler).observe(time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
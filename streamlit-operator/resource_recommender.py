@@ -0,0 +1,77 @@
+import math
+import time
+from collections import defaultdict, deque
+
+from kubernetes.utils import parse_quantity
+
+# Container names in the Deployment, and the spec.resources field each container's requests belong in
+CONTAINER_FIELDS = {"streamlit": "streamlit", "git-sync": "gitSync"}
+
+CPU_STEP_MILLICORES = 10
+MEMORY_STEP_MIB = 16
+
+
+class ResourceRecommender:
+    """Keeps a sliding window of per-pod usage samples for each app, and suggests requests from it.
+
+    CPU requests cover ``cpu_percentile`` of the sampled usage: short spikes above it can use idle CPU on the node,
+    since profiles set no CPU limits. Memory requests cover the peak usage times ``memory_headroom``, since running
+    short of memory gets the pod OOM-killed or evicted rather than slowed down.
+
+    Samples are kept in memory only, so the window restarts when the operator restarts (or the app moves to another
+    replica) and recommendations only resume once ``min_samples`` have been collected again.
+    """
+
+    def __init__(self, window_seconds: float, min_samples: int, cpu_percentile: float, memory_headroom: float):
+        self._window_seconds = window_seconds
+        self._min_samples = min_samples
+        self._cpu_percentile = cpu_percentile
+        self._memory_headroom = memory_headroom
+        # app -> container field -> (sampled at, cpu cores, memory bytes)
+        self._samples: dict[str, dict[str, deque[tuple[float, float, float]]]] = defaultdict(lambda: defaultdict(deque))
+
+    def add(self, app: str, pod_metrics: list[dict]) -> None:
+        """Record one sample per container of each ``metrics.k8s.io/v1beta1`` PodMetrics of the app."""
+        now = time.monotonic()
+        for pod in pod_metrics:
+            for container in pod.get("containers", []):
+                field = CONTAINER_FIELDS.get(container["name"])
+                if field is None:
+                    continue
+                usage = container["usage"]
+                self._samples[app][field].append(
+                    (now, float(parse_quantity(usage["cpu"])), float(parse_quantity(usage["memory"])))
+                )
+
+        for samples in self._samples[app].values():
+            while samples and samples[0][0] < now - self._window_seconds:
+                samples.popleft()
+
+    def samples(self, app: str) -> int:
+        return min((len(samples) for samples in self._samples[app].values()), default=0)
+
+    def recommend(self, app: str) -> dict | None:
+        """Suggested requests in the shape of ``spec.resources``, or None until there are enough samples."""
+        if self.samples(app) < self._min_samples:
+            return None
+
+        recommendation = {}
+        for field, samples in self._samples[app].items():
+            cpu = sorted(sample[1] for sample in samples)
+            cpu_cores = cpu[min(len(cpu) - 1, math.ceil(self._cpu_percentile * len(cpu)) - 1)]
+            memory_bytes = max(sample[2] for sample in samples) * self._memory_headroom
+            recommendation[field] = {"requests": {"cpu": format_cpu(cpu_cores), "memory": format_memory(memory_bytes)}}
+        return recommendation
+
+    def forget(self, app: str) -> None:
+        self._samples.pop(app, None)
+
+
+def format_cpu(cores: float) -> str:
+    millicores = max(1, math.ceil(cores * 1000 / CPU_STEP_MILLICORES)) * CPU_STEP_MILLICORES
+    return f"{millicores}m"
+
+
+def format_memory(memory_bytes: float) -> str:
+    mib = max(1, math.ceil(memory_bytes / 2**20 / MEMORY_STEP_MIB)) * MEMORY_STEP_MIB
+    return f"{mib}Mi"
@@ -0,0 +1,284 @@
+import asyncio
+import bisect
+import datetime
+import hashlib
+import logging
+from collections.abc import Awaitable, Callable, Iterable
+
+import kopf
+from kube_clients import KubeClients
+from kubernetes.client.rest import ApiException
+
+LEADER_LEASE_NAME = "streamlit-operator-leader"
+MEMBER_LEASE_PREFIX = "streamlit-operator-member-"
+MEMBER_LEASE_LABEL = "fetch.com/operator-shard-member"
+
+# Points per member on the ring, enough to spread apps evenly over a handful of replicas
+VIRTUAL_NODES = 128
+
+
+class HashRing:
+    """Consistent hash ring assigning each key to one member.
+
+    Adding or removing a member only moves the keys that member gains or loses (about 1/N of them), everything else
+    stays where it was.
+    """
+
+    def __init__(self, members: Iterable[str], virtual_nodes: int = VIRTUAL_NODES):
+        self.members = frozenset(members)
+        points = sorted((_hash(f"{member}#{i}"), member) for member in self.members for i in range(virtual_nodes))
+        self._hashes = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key: str) -> str | None:
+        if not self._owners:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class ShardCoordinator:
+    """Lease-based membership, sharding and leader election between operator replicas.
+
+    Every replica keeps a member Lease renewed; the replicas whose member Leases are fresh form the hash ring that
+    StreamlitApps are sharded over. One replica additionally holds the leader Lease and runs the singleton work.
+    ``on_members_changed`` is called with the previous and new ring whenever membership changes, and
+    ``on_leading_changed`` whenever this replica gains or loses leadership.
+    """
+
+    def __init__(
+        self,
+        kube: KubeClients,
+        namespace: str,
+        identity: str,
+        lease_duration_seconds: int,
+        renew_interval_seconds: int,
+        on_members_changed: Callable[[HashRing, HashRing], Awaitable[None]],
+        on_leading_changed: Callable[[bool], Awaitable[None]],
+    ):
+        self.kube = kube
+        self.namespace = namespace
+        self.identity = identity
+        self.ring = HashRing(())
+        self.leading = False
+        self._lease_duration_seconds = lease_duration_seconds
+        self._renew_interval_seconds = renew_interval_seconds
+        self._on_members_changed = on_members_changed
+        self._on_leading_changed = on_leading_changed
+        self._led_at = _now()
+
+    def owns(self, key: str) -> bool:
+        # Until the first membership round completes nothing is owned, so a starting replica never races the others
+        return self.ring.owner(key) == self.identity
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self._renew_interval_seconds)
+            await self.tick()
+
+    async def tick(self) -> None:
+        """One round of renewing leases, refreshing membership and contending for leadership."""
+        try:
+            await self._renew_member_lease()
+            members = await self._list_members()
+        except ApiException:
+            logging.exception("Error refreshing operator shard membership")
+        else:
+            # Never drop ourselves from the ring just because our own renewal raced the listing
+            ring = HashRing(members | {self.identity})
+            if ring.members != self.ring.members:
+                previous, self.ring = self.ring, ring
+                logging.info("Operator shard members changed to %s", sorted(ring.members))
+                await self._on_members_changed(previous, ring)
+
+        leading = await self._try_lead()
+        if leading != self.leading:
+            self.leading = leading
+            logging.info("%s leadership of the operator", "Acquired" if leading else "Lost")
+            await self._on_leading_changed(leading)
+
+    async def leave(self) -> None:
+        """Give up leadership and membership right away, instead of letting the other replicas wait for expiry."""
+        if self.leading:
+            try:
+                lease = await self.kube.call(
+                    self.kube.coordination.read_namespaced_lease, name=LEADER_LEASE_NAME, namespace=self.namespace
+                )
+                if lease.spec.holder_identity == self.identity:
+                    await self.kube.call(
+                        self.kube.coordination.patch_namespaced_lease,
+                        name=LEADER_LEASE_NAME,
+                        namespace=self.namespace,
+                        body={
+                            "metadata": {"resourceVersion": lease.metadata.resource_version},
+                            "spec": {"holderIdentity": None},
+                        },
+                    )
+            except ApiException:
+                logging.warning("Could not release the leader lease", exc_info=True)
+        try:
+            await self.kube.call(
+                self.kube.coordination.delete_namespaced_lease,
+                name=MEMBER_LEASE_PREFIX + self.identity,
+                namespace=self.namespace,
+            )
+        except ApiException:
+            logging.warning("Could not delete the member lease", exc_info=True)
+
+    async def _renew_member_lease(self) -> None:
+        name = MEMBER_LEASE_PREFIX + self.identity
+        body = {
+            "apiVersion": "coordination.k8s.io/v1",
+            "kind": "Lease",
+            "metadata": {"name": name, "labels": {MEMBER_LEASE_LABEL: "true"}},
+            "spec": {
+                "holderIdentity": self.identity,
+                "leaseDurationSeconds": self._lease_duration_seconds,
+                "renewTime": _micro_time(_now()),
+            },
+        }
+        try:
+            await self.kube.call(
+                self.kube.coordination.patch_namespaced_lease, name=name, namespace=self.namespace, body=body
+            )
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            await self.kube.call(self.kube.coordination.create_namespaced_lease, namespace=self.namespace, body=body)
+
+    async def _list_members(self) -> set[str]:
+        leases = await self.kube.call(
+            self.kube.coordination.list_namespaced_lease,
+            namespace=self.namespace,
+            label_selector=f"{MEMBER_LEASE_LABEL}=true",
+        )
+        now = _now()
+        return {
+            lease.spec.holder_identity
+            for lease in leases.items
+            if lease.spec.holder_identity and not _expired(lease.spec, now)
+        }
+
+    async def _try_lead(self) -> bool:
+        now = _now()
+        try:
+            acquired = await self._acquire_or_renew_leader_lease(now)
+        except ApiException:
+            logging.exception("Error contending for the leader lease")
+            # A leader that cannot reach the API keeps leading until its lease could have been taken over, not longer
+            return self.leading and (now - self._led_at).total_seconds() < self._lease_duration_seconds
+
+        if acquired:
+            self._led_at = now
+        return acquired
+
+    async def _acquire_or_renew_leader_lease(self, now: datetime.datetime) -> bool:
+        coordination = self.kube.coordination
+        try:
+            lease = await self.kube.call(
+                coordination.read_namespaced_lease, name=LEADER_LEASE_NAME, namespace=self.namespace
+            )
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            body = {
+                "apiVersion": "coordination.k8s.io/v1",
+                "kind": "Lease",
+                "metadata": {"name": LEADER_LEASE_NAME},
+                "spec": {
+                    "holderIdentity": self.identity,
+                    "leaseDurationSeconds": self._lease_duration_seconds,
+                    "acquireTime": _micro_time(now),
+                    "renewTime": _micro_time(now),
+                    "leaseTransitions": 0,
+                },
+            }
+            try:
+                await self.kube.call(coordination.create_namespaced_lease, namespace=self.namespace, body=body)
+            except ApiException as e:
+                if e.status == 409:
+                    return False  # Another replica created it first
+                raise
+            return True
+
+        spec = lease.spec
+        held = spec.holder_identity == self.identity
+        if not held and spec.holder_identity and not _expired(spec, now):
+            return False
+
+        body = {
+            "apiVersion": "coordination.k8s.io/v1",
+            "kind": "Lease",
+            # The read resourceVersion makes the replace a compare-and-swap, so only one contender wins a takeover
+            "metadata": {"name": LEADER_LEASE_NAME, "resourceVersion": lease.metadata.resource_version},
+            "spec": {
+                "holderIdentity": self.identity,
+                "leaseDurationSeconds": self._lease_duration_seconds,
+                "acquireTime": _micro_time(spec.acquire_time if held and spec.acquire_time else now),
+                "renewTime": _micro_time(now),
+                "leaseTransitions": (spec.lease_transitions or 0) + (0 if held else 1),
+            },
+        }
+        try:
+            await self.kube.call(
+                coordination.replace_namespaced_lease, name=LEADER_LEASE_NAME, namespace=self.namespace, body=body
+            )
+        except ApiException as e:
+            if e.status == 409:
+                return False
+            raise
+        return True
+
+
+class OwnedDiffBaseStorage(kopf.AnnotationsDiffBaseStorage):
+    """kopf's last-handled-configuration annotation, written only by the replica that owns the object.
+
+    kopf stores it after any handling cycle of a change, including one in which no handler ran. A replica that does not
+    own an app must never do that, or the owner would see the change as already handled and drop it.
+    """
+
+    def __init__(self, owns: Callable[..., bool]):
+        super().__init__()
+        self._owns = owns
+
+    def store(self, *, body: kopf.Body, patch: kopf.Patch, essence: kopf.BodyEssence) -> None:
+        if self._owns(name=body["metadata"]["name"]):
+            super().store(body=body, patch=patch, essence=essence)
+
+
+class OwnedProgressStorage(kopf.SmartProgressStorage):
+    """kopf's handler progress, written only by the replica that owns the object (see OwnedDiffBaseStorage)."""
+
+    def __init__(self, owns: Callable[..., bool]):
+        super().__init__()
+        self._owns = owns
+
+    def store(self, *, key: str, record: kopf.ProgressRecord, body: kopf.Body, patch: kopf.Patch) -> None:
+        if self._owns(name=body["metadata"]["name"]):
+            super().store(key=key, record=record, body=body, patch=patch)
+
+    def purge(self, *, key: str, body: kopf.Body, patch: kopf.Patch) -> None:
+        if self._owns(name=body["metadata"]["name"]):
+            super().purge(key=key, body=body, patch=patch)
+
+    def touch(self, *, body: kopf.Body, patch: kopf.Patch, value: str | None) -> None:
+        if self._owns(name=body["metadata"]["name"]):
+            super().touch(body=body, patch=patch, value=value)
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "big")
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.UTC)
+
+
+def _micro_time(t: datetime.datetime) -> str:
+    return t.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _expired(spec, now: datetime.datetime) -> bool:
+    if spec.renew_time is None:
+        return True
+    return (now - spec.renew_time).total_seconds() > (spec.lease_duration_seconds or 0)
@@ -2,4 +2,5 @@
 
 pip install -r requirements.txt
 
-python -m kopf run --liveness=http://0.0.0.0:8080/healthz --namespace=streamlit main.py
+# --standalone: replicas coordinate through our own shard leases (sharding.py) instead of kopf's peering
+python -m kopf run --standalone --liveness=http://0.0.0.0:8080/healthz --namespace=streamlit main.py
@@ -0,0 +1,70 @@
+"""Where the time goes between the creation of a Streamlit app pod and the first healthy ``/_stcore/health``.
+
+The pod's status covers scheduling and everything up to the Streamlit container starting (volume mounts, image pulls).
+launch.sh times the phases inside the container and, once the server first answers its health check, prints them as a
+single ``STARTUP_PHASES`` line, which the operator reads back from the container log when the pod becomes ready.
+"""
+
+import datetime
+
+STARTUP_LOG_PREFIX = "STARTUP_PHASES "
+# The server logs little between its first healthy check and the pod turning ready, so the line is near the end
+STARTUP_LOG_TAIL_LINES = 200
+
+# Phases timed inside the container by launch.sh, in order
+CONTAINER_PHASES = ("clone", "dependencies", "server")
+
+
+def parse_startup_line(log: str) -> dict[str, str] | None:
+    """The fields of the last ``STARTUP_PHASES key=value ...`` line of ``log``, or None if there is none."""
+    for line in reversed(log.splitlines()):
+        if line.startswith(STARTUP_LOG_PREFIX):
+            fields = line.removeprefix(STARTUP_LOG_PREFIX).split()
+            return dict(field.split("=", 1) for field in fields if "=" in field)
+    return None
+
+
+def pod_condition_time(pod: dict, condition: str) -> datetime.datetime | None:
+    """When the pod's ``condition`` last turned true, or None if it isn't true."""
+    for cond in pod.get("status", {}).get("conditions") or []:
+        if cond["type"] == condition and cond["status"] == "True" and cond.get("lastTransitionTime"):
+            return datetime.datetime.fromisoformat(cond["lastTransitionTime"])
+    return None
+
+
+def container_started_at(pod: dict, container: str) -> datetime.datetime | None:
+    for status in pod.get("status", {}).get("containerStatuses") or []:
+        started_at = (status.get("state", {}).get("running") or {}).get("startedAt")
+        if status["name"] == container and started_at:
+            return datetime.datetime.fromisoformat(started_at)
+    return None
+
+
+def startup_phases(pod: dict, log: str) -> dict:
+    """Seconds spent in each phase of the startup of a ready ``pod``, as far as its status and ``log`` show them.
+
+    ``totalSeconds`` runs from the pod's creation until it turned ready, so it also includes the (up to one probe
+    period of) delay between the first healthy check of launch.sh and the kubelet's.
+    """
+    created_at = datetime.datetime.fromisoformat(pod["metadata"]["creationTimestamp"])
+    scheduled_at = pod_condition_time(pod, "PodScheduled")
+    started_at = container_started_at(pod, "streamlit")
+    ready_at = pod_condition_time(pod, "Ready")
+
+    phases = {}
+    if scheduled_at is not None:
+        phases["scheduling"] = (scheduled_at - created_at).total_seconds()
+        if started_at is not None:
+            phases["containerStart"] = (started_at - scheduled_at).total_seconds()
+    fields = parse_startup_line(log) or {}
+    for phase in CONTAINER_PHASES:
+        if phase in fields:
+            phases[phase] = float(fields[phase])
+
+    return {
+        "pod": pod["metadata"]["name"],
+        "readyAt": ready_at.isoformat() if ready_at is not None else None,
+        "totalSeconds": (ready_at - created_at).total_seconds() if ready_at is not None else None,
+        "phases": phases,
+        "dependencyCache": fields.get("dependencyCache"),
+    }
@@ -1,102 +1,395 @@
-from streamlit_app_spec_schema import StreamlitAppSpec
-from streamlit_operator_config import GitSyncAuthConfig
+import hashlib
+import hmac
+import json
+import math
+from collections.abc import Mapping
 
+from git_cache import mirror_dir_name
+from streamlit_app_spec_schema import ContainerResources, ResourceProfile, Resources, StreamlitAppSpec
+from streamlit_operator_config import DependencyCacheConfig, GitCacheConfig, GitPollerConfig, GitSyncAuthConfig
 
-def template_deployment(name, streamlit_app_spec: StreamlitAppSpec, git_sync_auth_config: GitSyncAuthConfig):
-    spec = streamlit_app_spec
-    common_env = [
-        {"name": "DEBIAN_FRONTEND", "value": "noninteractive"},
-    ]
-
-    deployment_dict = {
-        "apiVersion": "apps/v1",
-        "kind": "Deployment",
-        "metadata": {"name": name, "namespace": "streamlit", "labels": {"app": name, **spec.additionalLabels}},
-        "spec": {
-            "replicas": spec.replicas,
-            "selector": {"matchLabels": {"app": name}},
-            "template": {
-                "metadata": {"labels": {"app": name, "app.kubernetes.io/name": name, **spec.additionalLabels}},
-                "spec": {
-                    "enableServiceLinks": spec.enableServiceLinks,
-                    "strategy": {"type": "RollingUpdate", "rollingUpdate": {"maxUnavailable": 1, "maxSurge": 0}},
-                    "securityContext": {"fsGroup": 65533},  # to make SSH key readable
-                    "serviceAccountName": spec.serviceAccountName,
-                    "containers": [
-                        {
-                            "name": "streamlit",
-                            "image": spec.image,
-                            "env": [
-                                {"name": "IN_HUB", "value": "True"},
-                                {"name": "CODE_DIR", "value": f"repo/{spec.codeDir}"},
-                                {"name": "ENTRYPOINT", "value": spec.entrypoint},
-                                {"name": "REQUIREMENTS", "value": spec.requirements},
-                                *common_env,
-                                *spec.additionalEnv,
-                            ],
-                            "command": ["/app/launch/launch.sh"],
-                            "ports": [{"containerPort": 80}],
-                            "volumeMounts": [
-                                {"name": "code", "mountPath": "/app"},
-                                {"name": "launch", "mountPath": "/app/launch"},
-                                *spec.additionalVolumeMounts,
-                            ],
-                            "livenessProbe": {
-                                "httpGet": {"path": "/_stcore/health", "port": 80},
-                                "failureThreshold": 3,
-                                "periodSeconds": 10,
-                            },
-                            "readinessProbe": {
-                                "httpGet": {"path": "/_stcore/health", "port": 80},
-                                "failureThreshold": 3,
-                                "periodSeconds": 10,
+# Port of the connection tracker (launch/activity.py) that idle scaling polls, and the Service that serves sleeping apps
+ACTIVITY_PORT = 8502
+ACTIVATOR_SERVICE_NAME = "streamlit-activator"
+# The kubelet only sees a starting pod become healthy on its next startup probe, which delays its readiness by up to
+# one period, so starting pods are probed more often than running ones
+STARTUP_PROBE_PERIOD_SECONDS = 5
+
+# Pod annotation the operator's git poller sets to the latest commit of the app's ref, see launch.sh
+GIT_REVISION_ANNOTATION = "fetch.com/git-revision"
+PODINFO_MOUNT_PATH = "/etc/podinfo"
+# Pod annotation the operator sets to ask launch.sh to restart the Streamlit process (but nothing else) in place
+RELOAD_ANNOTATION = "fetch.com/reload-requested"
+# Pod template annotation of `kubectl rollout restart`, changing it rolls the Deployment's pods
+RESTARTED_AT_ANNOTATION = "kubectl.kubernetes.io/restartedAt"
+
+# Pod annotation holding the app's sparse-checkout patterns, which git-sync reads through a downward API volume
+SPARSE_CHECKOUT_ANNOTATION = "fetch.com/sparse-checkout"
+CHECKOUT_MOUNT_PATH = "/etc/git-checkout"
+GIT_CACHE_MOUNT_PATH = "/var/cache/git-mirrors"
+
+NGINX_STICKY_SESSION_ANNOTATIONS = {
+    "nginx.ingress.kubernetes.io/affinity": "cookie",
+    "nginx.ingress.kubernetes.io/affinity-mode": "persistent",
+    "nginx.ingress.kubernetes.io/session-cookie-name": "streamlit-affinity",
+}
+
+
+def template_deployment(
+    name,
+    streamlit_app_spec: StreamlitAppSpec,
+    git_sync_auth_config: GitSyncAuthConfig,
+    dependency_cache: DependencyCacheConfig | None = None,
+    *,
+    git_poller: GitPollerConfig | None = None,
+    git_cache: GitCacheConfig | None = None,
+    activity_token_key: str | None = None,
+    resources: ResourceProfile | None = None,
+    restarted_at: str | None = None,
+    asleep: bool = False,
+):
+    template = DeploymentTemplate(
+        git_sync_auth_config,
+        dependency_cache,
+        git_poller=git_poller,
+        git_cache=git_cache,
+        activity_token_key=activity_token_key,
+    )
+    return template.render(name, streamlit_app_spec, resources=resources, restarted_at=restarted_at, asleep=asleep)
+
+
+class DeploymentTemplate:
+    """Renders app Deployments from the parts that only depend on the operator config, which are built once.
+
+    Those parts are shared by every Deployment the template renders instead of being copied into each one, so rendered
+    manifests must not be modified in place (``kopf.adopt`` only touches their top-level metadata, which is not shared).
+    """
+
+    def __init__(
+        self,
+        git_sync_auth_config: GitSyncAuthConfig,
+        dependency_cache: DependencyCacheConfig | None = None,
+        *,
+        git_poller: GitPollerConfig | None = None,
+        git_cache: GitCacheConfig | None = None,
+        activity_token_key: str | None = None,
+    ):
+        self._activity_token_key = activity_token_key
+        common_env = [
+            {"name": "DEBIAN_FRONTEND", "value": "noninteractive"},
+        ]
+
+        self._git_poller_enabled = git_poller is not None and git_poller.enabled
+        git_sync_period = "10s"
+        git_poller_env = []
+        if self._git_poller_enabled:
+            # git-sync only fetches when launch.sh signals it, after the operator annotates the pod with a new revision
+            git_sync_period = git_poller.fallbackSyncPeriod  # type: ignore
+            git_poller_env = [{"name": "GITSYNC_SYNC_ON_SIGNAL", "value": "SIGHUP"}]
+        # launch.sh follows the operator's signals (git revision, reload requests) through the pod's annotations
+        podinfo_volume_mounts = [{"name": "podinfo", "mountPath": PODINFO_MOUNT_PATH, "readOnly": True}]
+        podinfo_volumes = [
+            {
+                "name": "podinfo",
+                "downwardAPI": {"items": [{"path": "annotations", "fieldRef": {"fieldPath": "metadata.annotations"}}]},
+            }
+        ]
+
+        self._git_cache = git_cache if git_cache is not None and git_cache.enabled else None
+        self._git_cache_volume_mount = {"name": "git-cache", "mountPath": GIT_CACHE_MOUNT_PATH, "readOnly": True}
+        if self._git_cache is not None:
+            self._git_cache_volume = {
+                "name": "git-cache",
+                "hostPath": {"path": self._git_cache.hostPath, "type": "DirectoryOrCreate"},
+            }
+
+        dependency_cache_env = []
+        dependency_cache_volume_mounts = []
+        dependency_cache_volumes = []
+        if dependency_cache is not None:
+            dependency_cache_env = [{"name": "DEPS_CACHE_DIR", "value": dependency_cache.mountPath}]
+            dependency_cache_volume_mounts = [{"name": "deps-cache", "mountPath": dependency_cache.mountPath}]
+            dependency_cache_volumes = [
+                {"name": "deps-cache", "persistentVolumeClaim": {"claimName": dependency_cache.claimName}}
+            ]
+
+        # Each list below is spliced into the app's own lists at the position noted, in order
+        self._streamlit_env_head = [{"name": "IN_HUB", "value": "True"}]
+        self._streamlit_env_tail = [  # Before spec.additionalEnv
+            {"name": "ACTIVITY_PORT", "value": str(ACTIVITY_PORT)},
+            {"name": "GIT_REVISION_ANNOTATION", "value": GIT_REVISION_ANNOTATION},
+            {"name": "RELOAD_ANNOTATION", "value": RELOAD_ANNOTATION},
+            *dependency_cache_env,
+            *common_env,
+        ]
+        self._streamlit_volume_mounts = [  # Before spec.additionalVolumeMounts
+            {"name": "code", "mountPath": "/app"},
+            {"name": "launch", "mountPath": "/app/launch"},
+            *dependency_cache_volume_mounts,
+            *podinfo_volume_mounts,
+        ]
+        self._git_sync_volume_mounts = [  # Before the checkout volume mounts
+            *git_sync_auth_config.volumeMounts,
+            {"name": "code", "mountPath": "/tmp/code"},
+        ]
+        self._git_sync_env_tail = [  # After the checkout env
+            *git_poller_env,
+            *git_sync_auth_config.env,
+            *common_env,
+        ]
+        self._git_sync_env_static = [  # After GITSYNC_REPO and GITSYNC_REF
+            {"name": "GITSYNC_ROOT", "value": "/tmp/code"},
+            {"name": "GITSYNC_LINK", "value": "repo"},
+            {"name": "GITSYNC_SSH_KNOWN_HOSTS", "value": "true"},
+            {"name": "GITSYNC_PERIOD", "value": git_sync_period},
+            {"name": "GITSYNC_MAX_FAILURES", "value": "6"},
+        ]
+        self._volumes = [  # Before the checkout volumes
+            {"name": "code", "emptyDir": {}},
+            {"name": "launch", "configMap": {"name": "streamlit-launch-script", "defaultMode": 0o500}},
+            *git_sync_auth_config.volumes,
+            *dependency_cache_volumes,
+            *podinfo_volumes,
+        ]
+        self._ports = [{"containerPort": 80}, {"containerPort": ACTIVITY_PORT, "name": "activity"}]
+        self._health_probe = {
+            "httpGet": {"path": "/_stcore/health", "port": 80},
+            "failureThreshold": 3,
+            "periodSeconds": 10,
+        }
+        self._startup_probe_http_get = {"path": "/_stcore/health", "port": 80}
+        self._pod_security_context = {"fsGroup": 65533}  # to make SSH key readable
+        self._git_sync_security_context = {"runAsUser": 65533}  # git-sync user
+        self._sparse_checkout_volume_mount = {
+            "name": "git-checkout",
+            "mountPath": CHECKOUT_MOUNT_PATH,
+            "readOnly": True,
+        }
+        self._sparse_checkout_volume = {
+            "name": "git-checkout",
+            "downwardAPI": {
+                "items": [
+                    {
+                        "path": "sparse-checkout",
+                        "fieldRef": {"fieldPath": f"metadata.annotations['{SPARSE_CHECKOUT_ANNOTATION}']"},
+                    }
+                ]
+            },
+        }
+
+    def render(
+        self,
+        name,
+        streamlit_app_spec: StreamlitAppSpec,
+        *,
+        resources: ResourceProfile | None = None,
+        restarted_at: str | None = None,
+        asleep: bool = False,
+    ) -> dict:
+        spec = streamlit_app_spec
+        resources = resources or ResourceProfile()
+
+        checkout_env = [{"name": "GITSYNC_DEPTH", "value": str(spec.checkout.depth)}]
+        if spec.checkout.filter:
+            # git-sync has no filter flag, but git applies a promisor remote's filter to every fetch from its URL
+            git_config = {
+                f"remote.{spec.repo}.promisor": "true",
+                f"remote.{spec.repo}.partialclonefilter": spec.checkout.filter,
+            }
+            checkout_env.append(
+                {
+                    "name": "GITSYNC_GIT_CONFIG",
+                    "value": ",".join(f"{quote_git_config(k)}:{quote_git_config(v)}" for k, v in git_config.items()),
+                }
+            )
+        pod_annotations = {RESTARTED_AT_ANNOTATION: restarted_at} if restarted_at else {}
+        # Without a token, activity.py turns down every request to its POST endpoints
+        activity_token_env = []
+        if self._activity_token_key:
+            activity_token_env = [{"name": "ACTIVITY_TOKEN", "value": activity_token(self._activity_token_key, name)}]
+        checkout_volume_mounts = []
+        checkout_volumes = []
+        sparse_checkout_dirs = [spec.codeDir, *spec.checkout.extraPaths]
+        if spec.checkout.sparse and all(directory not in ("", ".") for directory in sparse_checkout_dirs):
+            pod_annotations[SPARSE_CHECKOUT_ANNOTATION] = sparse_checkout_patterns(sparse_checkout_dirs)
+            checkout_env.append(
+                {"name": "GITSYNC_SPARSE_CHECKOUT_FILE", "value": f"{CHECKOUT_MOUNT_PATH}/sparse-checkout"}
+            )
+            checkout_volume_mounts.append(self._sparse_checkout_volume_mount)
+            checkout_volumes.append(self._sparse_checkout_volume)
+
+        if self._git_cache is not None:
+            # git reads objects from the node's mirror before fetching them, and skips a mirror that does not exist yet
+            mirror_objects = f"{GIT_CACHE_MOUNT_PATH}/{mirror_dir_name(spec.repo)}/objects"
+            checkout_env.append({"name": "GIT_ALTERNATE_OBJECT_DIRECTORIES", "value": mirror_objects})
+            checkout_volume_mounts.append(self._git_cache_volume_mount)
+            checkout_volumes.append(self._git_cache_volume)
+
+        deployment_dict = {
+            "apiVersion": "apps/v1",
+            "kind": "Deployment",
+            "metadata": {"name": name, "namespace": "streamlit", "labels": {"app": name, **spec.additionalLabels}},
+            "spec": {
+                "selector": {"matchLabels": {"app": name}},
+                "strategy": {
+                    "type": "RollingUpdate",
+                    "rollingUpdate": {
+                        "maxSurge": spec.rollout.maxSurge,
+                        "maxUnavailable": spec.rollout.maxUnavailable,
+                    },
+                },
+                "minReadySeconds": spec.rollout.minReadySeconds,
+                "progressDeadlineSeconds": spec.rollout.progressDeadlineSeconds,
+                "template": {
+                    "metadata": {
+                        "labels": {"app": name, "app.kubernetes.io/name": name, **spec.additionalLabels},
+                        **({"annotations": pod_annotations} if pod_annotations else {}),
+                    },
+                    "spec": {
+                        "enableServiceLinks": spec.enableServiceLinks,
+                        # Lets launch.sh signal the git-sync sidecar
+                        "shareProcessNamespace": self._git_poller_enabled,
+                        "terminationGracePeriodSeconds": spec.rollout.drainSeconds + 30,
+                        "securityContext": self._pod_security_context,
+                        "serviceAccountName": spec.serviceAccountName,
+                        "containers": [
+                            {
+                                "name": "streamlit",
+                                "image": spec.image,
+                                "env": [
+                                    *self._streamlit_env_head,
+                                    {"name": "CODE_DIR", "value": f"repo/{spec.codeDir}"},
+                                    {"name": "ENTRYPOINT", "value": spec.entrypoint},
+                                    {"name": "REQUIREMENTS", "value": spec.requirements},
+                                    {"name": "IMAGE", "value": spec.image},
+                                    {"name": "HOT_RELOAD", "value": str(spec.hotReload).lower()},
+                                    {"name": "IDLE_SCALING", "value": str(spec.idleScaling.enabled).lower()},
+                                    *activity_token_env,
+                                    *self._streamlit_env_tail,
+                                    *spec.additionalEnv,
+                                ],
+                                "command": ["/app/launch/launch.sh"],
+                                "resources": template_container_resources(resources.streamlit),
+                                "ports": self._ports,
+                                "volumeMounts": [*self._streamlit_volume_mounts, *spec.additionalVolumeMounts],
+                                "livenessProbe": self._health_probe,
+                                "readinessProbe": self._health_probe,
+                                # /_stcore/health only answers once dependencies are installed and the server is up,
+                                # so a rollout never routes traffic to a pod that is still bootstrapping
+                                "startupProbe": {
+                                    "httpGet": self._startup_probe_http_get,
+                                    "failureThreshold": math.ceil(
+                                        spec.rollout.startupTimeoutSeconds / STARTUP_PROBE_PERIOD_SECONDS
+                                    ),
+                                    "periodSeconds": STARTUP_PROBE_PERIOD_SECONDS,
+                                    "initialDelaySeconds": 5,
+                                },
+                                # Keep serving while the endpoint removal propagates to the ingress controller
+                                "lifecycle": {
+                                    "preStop": {"exec": {"command": ["sleep", str(spec.rollout.drainSeconds)]}}
+                                },
                             },
-                            "startupProbe": {
-                                "httpGet": {"path": "/_stcore/health", "port": 80},
-                                "failureThreshold": 30,
-                                "periodSeconds": 10,
-                                "initalDelaySeconds": 5,
+                            {
+                                "name": "git-sync",
+                                "image": "registry.k8s.io/git-sync/git-sync:v4.5.0",
+                                "volumeMounts": [*self._git_sync_volume_mounts, *checkout_volume_mounts],
+                                "env": [
+                                    {"name": "GITSYNC_REPO", "value": spec.repo},
+                                    {"name": "GITSYNC_REF", "value": spec.ref},
+                                    *self._git_sync_env_static,
+                                    *checkout_env,
+                                    *self._git_sync_env_tail,
+                                ],
+                                "securityContext": self._git_sync_security_context,
+                                "resources": template_container_resources(resources.gitSync),
                             },
-                        },
-                        {
-                            "name": "git-sync",
-                            "image": "registry.k8s.io/git-sync/git-sync:v4.5.0",
-                            "volumeMounts": [
-                                *git_sync_auth_config.volumeMounts,
-                                {"name": "code", "mountPath": "/tmp/code"},
-                            ],
-                            "env": [
-                                {"name": "GITSYNC_REPO", "value": spec.repo},
-                                {"name": "GITSYNC_REF", "value": spec.ref},
-                                {"name": "GITSYNC_ROOT", "value": "/tmp/code"},
-                                {"name": "GITSYNC_LINK", "value": "repo"},
-                                {"name": "GITSYNC_SSH_KNOWN_HOSTS", "value": "true"},
-                                {"name": "GITSYNC_PERIOD", "value": "10s"},
-                                {"name": "GITSYNC_MAX_FAILURES", "value": "6"},
-                                *git_sync_auth_config.env,
-                                *common_env,
-                            ],
-                            "securityContext": {"runAsUser": 65533},  # git-sync user
-                        },
-                    ],
-                    "volumes": [
-                        {"name": "code", "emptyDir": {}},
-                        {"name": "launch", "configMap": {"name": "streamlit-launch-script", "defaultMode": 0o500}},
-                        *git_sync_auth_config.volumes,
-                        *spec.additionalVolumes,
-                    ],
+                        ],
+                        "volumes": [*self._volumes, *checkout_volumes, *spec.additionalVolumes],
+                    },
                 },
             },
-        },
-    }
+        }
+
+        # Leave the replica count to the HPA when autoscaling, otherwise every apply would reset it
+        if asleep:
+            deployment_dict["spec"]["replicas"] = 0
+        elif not spec.autoscaling.enabled:
+            deployment_dict["spec"]["replicas"] = spec.replicas
+
+        return deployment_dict
+
+
+def activity_token(key: str, name: str) -> str:
+    """Token of the app ``name`` for the POST endpoints of its pods' activity.py, which only the operator can derive.
+
+    Each app gets its own, so an app that reads the token from its environment cannot call the pods of other apps.
+    """
+    return hmac.new(key.encode(), name.encode(), hashlib.sha256).hexdigest()
+
+
+def sparse_checkout_patterns(directories: list[str]) -> str:
+    """Sparse-checkout patterns in cone format for the given directories, plus the files at the repo root.
+
+    Cone format, because newer git defaults git-sync's ``git sparse-checkout init`` to cone mode, and the same patterns
+    select the same files in non-cone mode.
+    """
+    # A directory inside another one is already checked out, and its parent's "!/dir/*/" line would hide the other
+    directories = sorted(set(directories))
+    directories = [d for d in directories if not any(d.startswith(f"{other}/") for other in directories)]
+
+    patterns = {"/*": None, "!/*/": None}
+    for directory in directories:
+        parts = directory.split("/")
+        for depth in range(1, len(parts)):
+            parent = "/".join(parts[:depth])
+            patterns[f"/{parent}/"] = None
+            patterns[f"!/{parent}/*/"] = None
+        patterns[f"/{directory}/"] = None
+    return "\n".join(patterns) + "\n"
+
+
+def quote_git_config(value: str) -> str:
+    """Quote a key or value for git-sync's --git-config, which splits on unquoted colons and commas."""
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def resolve_resources(
+    resources: Resources,
+    profiles: Mapping[str, ResourceProfile],
+    default_profile: str | None,
+) -> ResourceProfile:
+    """The app's resource profile, with the requests and limits the app sets itself laid over it."""
+    profile_name = resources.profile or default_profile
+    if profile_name is None:
+        profile = ResourceProfile()
+    elif profile_name in profiles:
+        profile = profiles[profile_name]
+    else:
+        raise ValueError(f"Unknown resource profile {profile_name!r}, expected one of {sorted(profiles)}")
+    if resources.streamlit == resources.gitSync == ContainerResources():
+        return profile  # Nothing to lay over it
+
+    def overlay(base: ContainerResources, override: ContainerResources) -> ContainerResources:
+        return ContainerResources(
+            requests={**base.requests, **override.requests},
+            limits={**base.limits, **override.limits},
+        )
+
+    return ResourceProfile(
+        streamlit=overlay(profile.streamlit, resources.streamlit),
+        gitSync=overlay(profile.gitSync, resources.gitSync),
+    )
+
 
-    return deployment_dict
+def template_container_resources(resources: ContainerResources) -> dict:
+    return {field: quantities for field, quantities in resources.model_dump().items() if quantities}
 
 
 def template_service(name):
     svc_name = make_service_name(name)
     container_port = 80
     target_port = container_port
+
     service_dict = {
         "apiVersion": "v1",
         "kind": "Service",
@@ -106,6 +399,8 @@ def template_service(name):
             "selector": {"app": name},
         },
     }
+    # No sessionAffinity: clients other than ingress-nginx mostly reach the Service from a few proxy IPs, which ClientIP
+    # affinity would pin to a single replica
     return service_dict
 
 
@@ -113,18 +408,26 @@ def template_ingress(
     name,
     streamlit_app_spec: StreamlitAppSpec,
     dns_name: str,
+    *,
+    asleep: bool = False,
 ):
     ing_name = make_ingress_name(name)
-    service_name = make_service_name(name)
+    # While scaled to zero, requests go to the operator's activator, which wakes the app up
+    service_name = ACTIVATOR_SERVICE_NAME if asleep else make_service_name(name)
 
     spec = streamlit_app_spec
 
+    annotations = spec.ingress.annotations
+    if spec.stickySessions and spec.ingress.ingressClassName == "nginx":
+        # ingress-nginx routes straight to pod endpoints, so stickiness has to be set up on the ingress itself
+        annotations = {**NGINX_STICKY_SESSION_ANNOTATIONS, **annotations}
+
     ingress_dict = {
         "apiVersion": "networking.k8s.io/v1",
         "kind": "Ingress",
         "metadata": {
             "name": f"{ing_name}",
-            "annotations": spec.ingress.annotations,
+            "annotations": annotations,
         },
         "spec": {
             "ingressClassName": spec.ingress.ingressClassName,
@@ -147,9 +450,52 @@ def template_ingress(
     return ingress_dict
 
 
+def template_hpa(name, streamlit_app_spec: StreamlitAppSpec):
+    spec = streamlit_app_spec
+    autoscaling = spec.autoscaling
+    if not autoscaling.enabled:
+        return None
+
+    metrics = []
+    for resource, target in (
+        ("cpu", autoscaling.targetCPUUtilizationPercentage),
+        ("memory", autoscaling.targetMemoryUtilizationPercentage),
+    ):
+        if target is not None:
+            metrics.append(
+                {
+                    "type": "Resource",
+                    "resource": {"name": resource, "target": {"type": "Utilization", "averageUtilization": target}},
+                }
+            )
+
+    hpa_dict = {
+        "apiVersion": "autoscaling/v2",
+        "kind": "HorizontalPodAutoscaler",
+        "metadata": {"name": make_hpa_name(name), "namespace": "streamlit"},
+        "spec": {
+            "scaleTargetRef": {"apiVersion": "apps/v1", "kind": "Deployment", "name": name},
+            "minReplicas": autoscaling.minReplicas,
+            "maxReplicas": autoscaling.maxReplicas,
+            "metrics": [*metrics, *autoscaling.customMetrics],
+        },
+    }
+    return hpa_dict
+
+
 def make_service_name(name: str) -> str:
     return f"{name}-service"
 
 
 def make_ingress_name(name: str) -> str:
     return f"{name}-ing"
+
+
+def make_hpa_name(name: str) -> str:
+    return f"{name}-hpa"
+
+
+def hash_manifest(manifest: dict) -> str:
+    """Stable content hash of a templated manifest, used to skip writes for children that have not changed."""
+    canonical = json.dumps(manifest, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
@@ -8,18 +8,99 @@ class Ingress(BaseModel):
     ingressClassName: str = "nginx"
 
 
+class Autoscaling(BaseModel):
+    enabled: bool = False
+    minReplicas: int = 1
+    maxReplicas: int = 5
+    targetCPUUtilizationPercentage: int | None = 80
+    targetMemoryUtilizationPercentage: int | None = None
+    # Additional autoscaling/v2 MetricSpec entries, e.g. Pods or External metrics
+    customMetrics: list = []
+
+
+class Rollout(BaseModel):
+    # Surge-first by default, so a replacement pod is Ready before an old one is taken down (even with 1 replica)
+    maxSurge: int | str = 1
+    maxUnavailable: int | str = 0
+    minReadySeconds: int = 5
+    progressDeadlineSeconds: int = 900
+    # How long a new pod may take to clone the repo, install dependencies and pass its first health check
+    startupTimeoutSeconds: int = 600
+    # How long a terminating pod keeps serving after it is removed from the Service endpoints
+    drainSeconds: int = 10
+
+
+class IdleScaling(BaseModel):
+    # Scale the app to zero replicas after idleTimeoutMinutes without connections, and wake it on the next request
+    enabled: bool = False
+    idleTimeoutMinutes: int = 60
+
+
+class Checkout(BaseModel):
+    # Commits of history git-sync fetches, 0 for the full history. The app only ever runs the tip of its ref.
+    depth: int = 1
+    # Only check out codeDir and extraPaths rather than the whole repo. Files at the repo root are always checked out.
+    # Opt-in, since an app that reads files anywhere else breaks unless they are listed in extraPaths.
+    sparse: bool = False
+    # Further directories the app reads with a sparse checkout, e.g. a shared library elsewhere in a monorepo
+    extraPaths: list[str] = []
+    # Partial clone filter, e.g. "blob:none" so only the blobs the checkout needs are downloaded (best together with
+    # sparse). None downloads every blob.
+    filter: str | None = None
+
+    @field_validator("extraPaths", mode="after")
+    @classmethod
+    def remove_leading_and_trailing_slashes(cls, value: list[str]) -> list[str]:
+        return [path.strip("/") for path in value]
+
+
+class ContainerResources(BaseModel):
+    requests: dict[str, str] = {}
+    limits: dict[str, str] = {}
+
+    @field_validator("requests", "limits", mode="before")
+    @classmethod
+    def quantities_as_strings(cls, value):
+        # Allow plain numbers (cpu: 1), as Kubernetes does
+        return {k: str(v) for k, v in value.items()} if isinstance(value, dict) else value
+
+
+class ResourceProfile(BaseModel):
+    streamlit: ContainerResources = ContainerResources()
+    gitSync: ContainerResources = ContainerResources()
+
+
+class Resources(BaseModel):
+    # Named profile from the operator config (small/medium/large by default), or the operator's default profile. The
+    # streamlit/gitSync requests and limits set here override the profile's one by one.
+    profile: str | None = None
+    streamlit: ContainerResources = ContainerResources()
+    gitSync: ContainerResources = ContainerResources()
+
+
 class StreamlitAppSpec(BaseModel):
     repo: str
     ref: str
     codeDir: str
     entrypoint: str = "main.py"
     requirements: str = "requirements.txt"  # Path to requirements file relative to codeDir
+    checkout: Checkout = Checkout()
 
     enableServiceLinks: bool = False
     serviceAccountName: str = "default"
 
-    replicas: int = 1
+    # Reload code-only git-sync updates inside the running Streamlit server instead of restarting it. The server keeps
+    # the working directory it was started in, so disable this for apps that read files relative to the cwd.
+    hotReload: bool = True
+
+    replicas: int = 1  # Ignored when autoscaling is enabled
+    autoscaling: Autoscaling = Autoscaling()
+    # Pin each browser to one replica with a cookie, so Streamlit's websocket session survives reconnects when scaled
+    # out. Only applies to the nginx ingress class.
+    stickySessions: bool = True
+    idleScaling: IdleScaling = IdleScaling()
     image: str = "python:3.11.14-slim"
+    resources: Resources = Resources()
 
     additionalLabels: dict[str, str] = {}
     additionalVolumes: list = []
@@ -27,6 +108,7 @@ class StreamlitAppSpec(BaseModel):
     additionalEnv: list = []
 
     ingress: Ingress = Ingress()
+    rollout: Rollout = Rollout()
 
     @field_validator("codeDir", "entrypoint", "requirements", mode="after")
     @classmethod
@@ -34,14 +116,15 @@ class StreamlitAppSpec(BaseModel):
         return value.strip("/")
 
 
-def make_streamlit_app_manifest(name: str, **spec_kws) -> dict:
+def make_streamlit_app_manifest(name: str, *, exclude_unset: bool = False, **spec_kws) -> dict:
     spec = StreamlitAppSpec(**spec_kws)
 
+    # With exclude_unset, defaults are left to the operator instead of being frozen into the manifest
     manifest = {
         "apiVersion": "fetch.com/v1",
         "kind": "StreamlitApp",
         "metadata": {"name": name, "namespace": "streamlit"},
-        "spec": spec.model_dump(mode="json"),
+        "spec": spec.model_dump(mode="json", exclude_unset=exclude_unset),
     }
     return manifest
 
@@ -1,4 +1,22 @@
 from pydantic import BaseModel
+from streamlit_app_spec_schema import ResourceProfile
+
+# Requests sized from typical Streamlit apps. No CPU limits, so apps can burst into idle CPU instead of being throttled,
+# but memory limits, so one leaky app is OOM-killed instead of getting its neighbours evicted.
+DEFAULT_RESOURCE_PROFILES = {
+    "small": ResourceProfile(
+        streamlit={"requests": {"cpu": "100m", "memory": "256Mi"}, "limits": {"memory": "512Mi"}},
+        gitSync={"requests": {"cpu": "10m", "memory": "32Mi"}, "limits": {"memory": "128Mi"}},
+    ),
+    "medium": ResourceProfile(
+        streamlit={"requests": {"cpu": "250m", "memory": "512Mi"}, "limits": {"memory": "1Gi"}},
+        gitSync={"requests": {"cpu": "10m", "memory": "32Mi"}, "limits": {"memory": "128Mi"}},
+    ),
+    "large": ResourceProfile(
+        streamlit={"requests": {"cpu": "1", "memory": "2Gi"}, "limits": {"memory": "4Gi"}},
+        gitSync={"requests": {"cpu": "20m", "memory": "64Mi"}, "limits": {"memory": "256Mi"}},
+    ),
+}
 
 
 class GitSyncAuthConfig(BaseModel):
@@ -7,10 +25,96 @@ class GitSyncAuthConfig(BaseModel):
     volumes: list
 
 
+class DependencyCacheConfig(BaseModel):
+    # PVC (ReadWriteMany) shared by all app pods, holding installed dependencies keyed by image + requirements hash
+    claimName: str
+    mountPath: str = "/deps-cache"
+
+
+class GitPollerConfig(BaseModel):
+    # Resolve each distinct (repo, ref) once per interval in the operator and only make pods sync when it moves,
+    # instead of every replica of every app polling the git server itself
+    enabled: bool = False
+    intervalSeconds: int = 30
+    # Period of each pod's own git-sync loop, kept as a fallback in case a trigger is missed
+    fallbackSyncPeriod: str = "10m"
+    # Shared secret for push webhooks (GitHub X-Hub-Signature-256 or GitLab X-Gitlab-Token). Without one, the operator
+    # does not serve the webhook at all
+    webhookSecret: str | None = None
+
+
+class GitCacheConfig(BaseModel):
+    # Node-local mirrors of every app repo, kept up to date by the git cache DaemonSet. App pods' git-sync reads objects
+    # from the mirror of their node instead of downloading them from the git host.
+    enabled: bool = False
+    hostPath: str = "/var/cache/streamlit-git"
+
+
+class ShardingConfig(BaseModel):
+    # Spread StreamlitApps over all operator replicas by consistent hashing, and elect one leader for singleton work
+    # (hub bootstrap, git poller). Required when running more than one replica.
+    enabled: bool = False
+    # A replica that has not renewed its leases for this long is considered gone, and its apps move to the others
+    leaseDurationSeconds: int = 15
+    renewIntervalSeconds: int = 5
+
+
+class DriftDetectionConfig(BaseModel):
+    # Re-apply children (Deployment, Service, Ingress, HPA) of StreamlitApps that were edited or deleted behind the
+    # operator's back
+    enabled: bool = True
+    # Also check every app periodically, in case a watch event was missed
+    resyncIntervalSeconds: int = 600
+    # Global budget of repair writes per second, shared by all apps
+    maxRepairsPerSecond: float = 5.0
+    repairBurst: int = 10
+    workers: int = 4
+
+
+class StatusUpdatesConfig(BaseModel):
+    # Status updates of an app (mostly from its Deployment's events) are collected for this long and written in one
+    # patch, with only the fields that changed
+    debounceSeconds: float = 2
+    workers: int = 4
+
+
+class ResourceRecommenderConfig(BaseModel):
+    # Sample each app's actual usage from metrics-server (metrics.k8s.io) and write suggested requests into
+    # status.resourceRecommendation, in the shape of spec.resources
+    enabled: bool = False
+    windowMinutes: int = 24 * 60
+    # Don't recommend anything until the window holds this many samples (one per pod per minute)
+    minSamples: int = 60
+    # CPU requests cover this percentile of the sampled usage, memory requests the peak times the headroom
+    cpuPercentile: float = 0.95
+    memoryHeadroom: float = 1.2
+
+
 class StreamlitOperatorConfig(BaseModel):
     baseDnsRecord: str
     suffix: str = "-streamlit"
     gitRepo: str = "https://github.com/tbourton/streamlit-operator.git"
     gitRef: str = "main"
 
+    # Upper bound on the number of StreamlitApps reconciled at the same time
+    maxConcurrentReconciles: int = 20
+
+    # Port serving Prometheus metrics on /metrics
+    metricsPort: int = 9090
+
+    # Port of the activator that serves (and wakes up) StreamlitApps scaled to zero by idle scaling
+    activatorPort: int = 8082
+
+    # Named resource profiles apps can pick with spec.resources.profile, and the profile of apps that don't pick one.
+    # By default those get no requests or limits beyond their own, as before profiles existed.
+    resourceProfiles: dict[str, ResourceProfile] = DEFAULT_RESOURCE_PROFILES
+    defaultResourceProfile: str | None = None
+    resourceRecommender: ResourceRecommenderConfig = ResourceRecommenderConfig()
+
     gitSyncAuthConfig: GitSyncAuthConfig
+    dependencyCache: DependencyCacheConfig | None = None
+    gitPoller: GitPollerConfig = GitPollerConfig()
+    gitCache: GitCacheConfig = GitCacheConfig()
+    sharding: ShardingConfig = ShardingConfig()
+    driftDetection: DriftDetectionConfig = DriftDetectionConfig()
+    statusUpdates: StatusUpdatesConfig = StatusUpdatesConfig()